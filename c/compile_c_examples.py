@@ -26,55 +26,74 @@ Boston, MA 02111-1307, USA.
 import sys
 import os
 import shutil
-import subprocess
 
 sys.path.append(os.path.split(os.getcwd())[0])
 import common
 
-def walker(arg, dirname, names):
-    for name in names:
-        if not name.endswith('.c'):
-            continue
-
-        src = os.path.join(dirname, name);
-        dest = src[:-2];
-        device = '{0}_{1}'.format(os.path.split(os.path.split(dirname)[0])[-1], os.path.split(dirname)[-1])
-
-        args = ['/usr/bin/gcc',
-                '-std=c99',
-                '-Wall',
-                '-Wextra',
-                '-pthread',
-                '-I/tmp/compiler/bindings',
-                '-o',
-                dest,
-                '/tmp/compiler/bindings/ip_connection.c',
-                '/tmp/compiler/bindings/{0}.c'.format(device),
-                src]
-
-        print 'compiling ' + src
-        subprocess.call(args)
-
-def compile(path):
+def make_object_command(compiler_path, src):
+    dest = src[:-2] + '.o'
+    args = ['/usr/bin/gcc',
+            '-std=c99',
+            '-Wall',
+            '-Wextra',
+            '-pthread',
+            '-I' + compiler_path + '/bindings',
+            '-c',
+            '-o',
+            dest,
+            src]
+
+    return (os.path.relpath(src, compiler_path), args)
+
+def make_example_command(compiler_path, src):
+    dirname = os.path.dirname(src)
+    dest = src[:-2]
+    device = '{0}_{1}'.format(os.path.split(os.path.split(dirname)[0])[-1], os.path.split(dirname)[-1])
+
+    # ip_connection and the device bindings are only compiled once
+    args = ['/usr/bin/gcc',
+            '-std=c99',
+            '-Wall',
+            '-Wextra',
+            '-pthread',
+            '-I' + compiler_path + '/bindings',
+            '-o',
+            dest,
+            compiler_path + '/bindings/ip_connection.o',
+            compiler_path + '/bindings/{0}.o'.format(device),
+            src]
+
+    return (os.path.relpath(src, compiler_path), args)
+
+def compile(path, jobs=None):
     version = common.get_changelog_version(path)
     zipname = 'tinkerforge_c_bindings_{0}_{1}_{2}.zip'.format(*version)
 
     # Make temporary examples directory
-    if os.path.exists('/tmp/compiler'):
-        shutil.rmtree('/tmp/compiler/')
-    os.makedirs('/tmp/compiler')
-    os.chdir('/tmp/compiler')
-
-    shutil.copy(os.path.join(path, zipname), '/tmp/compiler/')
-
-    # unzip
-    print 'unpacking ' + zipname
-    args = ['/usr/bin/unzip',
-            os.path.join('/tmp/compiler', zipname)]
-    subprocess.call(args)
-
-    # compile
-    os.path.walk('/tmp/compiler/examples', walker, None)
+    compiler_path = common.make_temp_dir('compiler')
+    try:
+        # unzip
+        print 'unpacking ' + zipname
+        common.extract_zip(os.path.join(path, zipname), compiler_path)
+
+        # compile bindings
+        commands = []
+        for src in common.find_files(os.path.join(compiler_path, 'bindings'), '.c'):
+            commands.append(make_object_command(compiler_path, src))
+
+        results = common.run_commands(commands, compiler_path, jobs)
+
+        # compile examples
+        commands = []
+        for src in common.find_files(os.path.join(compiler_path, 'examples'), '.c'):
+            commands.append(make_example_command(compiler_path, src))
+
+        results += common.run_commands(commands, compiler_path, jobs)
+    finally:
+        # Remove temporary examples directory
+        shutil.rmtree(compiler_path)
+
+    return common.print_compile_summary('c', results)
 
 if __name__ == "__main__":
     compile(os.getcwd())
@@ -558,7 +558,7 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    c = file('{0}/{1}.c'.format(directory, file_name), "w")
+    c = common.open_output('{0}/{1}.c'.format(directory, file_name), "w")
     c.write(make_include_c())
     c.write(make_function_id_defines())
     c.write(make_typedefs())
@@ -568,7 +568,7 @@ def make_files(com_new, directory):
     c.write(make_register_callback_func())
     c.write(make_create_func())
 
-    h = file('{0}/{1}.h'.format(directory, file_name), "w")
+    h = common.open_output('{0}/{1}.h'.format(directory, file_name), "w")
     h.write(make_include_h())
     h.write(make_callback_defines())
     h.write(make_create_declaration())
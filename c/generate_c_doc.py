@@ -371,9 +371,9 @@ Alle folgend aufgelisteten Funktionen sind Thread-sicher.
 
     return api[lang].format(ref, api_desc, api_str)
 
-def copy_examples_for_zip():
+def copy_examples_for_zip(generator_path):
     examples = common.find_examples(device, file_path, 'c', 'example_', '.c')
-    dest = os.path.join('/tmp/generator/examples/', 
+    dest = os.path.join(generator_path, 'examples',
                         device.get_category().lower(),
                         device.get_underscore_name())
 
@@ -385,7 +385,9 @@ def copy_examples_for_zip():
 
 def make_files(com_new, directory):
     global device
+    global file_path
     device = common.Device(com_new)
+    file_path = directory
     file_name = '{0}_{1}_C'.format(device.get_camel_case_name(), device.get_category())
     title = {
     'en': 'C/C++ bindings',
@@ -396,47 +398,46 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    f = file('{0}/{1}.rst'.format(directory, file_name), "w")
+    f = common.open_output('{0}/{1}.rst'.format(directory, file_name), "w")
     f.write(common.make_rst_header(device, 'c', 'C/C++'))
     f.write(common.make_rst_summary(device, title[lang]))
     f.write(make_examples())
     f.write(make_api())
 
-    copy_examples_for_zip()
-
-def generate(path):
+def make_package(path):
+    global device
     global file_path
     file_path = path
-    path_list = path.split('/')
-    path_list[-1] = 'configs'
-    path_config = '/'.join(path_list)
-    sys.path.append(path_config)
-    configs = os.listdir(path_config)
 
     # Make temporary generator directory
-    if os.path.exists('/tmp/generator'):
-        shutil.rmtree('/tmp/generator/')
-    os.makedirs('/tmp/generator/bindings')
-    os.chdir('/tmp/generator/bindings')
-
-    for config in configs:
-        if config.endswith('_config.py'):
-            module = __import__(config[:-3])
-            print(" * {0}".format(config[:-10]))            
-            make_files(module.com, path)
-
-    # Copy bindings and readme
-    for filename in glob.glob(path + '/bindings/*.[ch]'):
-        shutil.copy(filename, '/tmp/generator/bindings')
-
-    shutil.copy(path + '/ip_connection.c', '/tmp/generator/bindings')
-    shutil.copy(path + '/ip_connection.h', '/tmp/generator/bindings')
-    shutil.copy(path + '/changelog.txt', '/tmp/generator/')
-    shutil.copy(path + '/readme.txt', '/tmp/generator/')
-
-    # Make zip
-    version = common.get_changelog_version(path)
-    common.make_zip('c', '/tmp/generator', path, version)
+    generator_path = common.make_temp_dir('generator')
+    try:
+        os.makedirs(generator_path + '/bindings')
+
+        # Copy examples
+        for config in common.get_configs(path):
+            device = common.Device(common.load_config(path, config))
+            copy_examples_for_zip(generator_path)
+
+        # Copy bindings and readme
+        for filename in glob.glob(path + '/bindings/*.[ch]'):
+            shutil.copy(filename, generator_path + '/bindings')
+
+        shutil.copy(path + '/ip_connection.c', generator_path + '/bindings')
+        shutil.copy(path + '/ip_connection.h', generator_path + '/bindings')
+        shutil.copy(path + '/changelog.txt', generator_path + '/')
+        shutil.copy(path + '/readme.txt', generator_path + '/')
+
+        # Make zip
+        version = common.get_changelog_version(path)
+        common.make_zip('c', generator_path, path, version)
+    finally:
+        # Remove temporary generator directory
+        shutil.rmtree(generator_path)
+
+def generate(path):
+    common.generate(path, make_files)
+    make_package(path)
 
 if __name__ == "__main__":
     generate(os.getcwd())
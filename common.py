@@ -29,6 +29,13 @@ import re
 import datetime
 import subprocess
 import sys
+import hashlib
+import tempfile
+import time
+import zipfile
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import cPickle as pickle
 
 gen_text_star = """/* ***********************************************************
  * This file was automatically generated on {0}.      *
@@ -125,6 +132,16 @@ lang = 'en'
 def shift_right(text, n):
     return text.replace('\n', '\n' + ' '*n)
 
+# Getters that return what their setter took, but whose value also changes
+# on the device itself, e.g. by a moving motor, a monoflop or an input pin,
+# or by another setter, e.g. SetVoltage of the Analog Out sets the mode to 0
+volatile_getters = {
+    'Stepper' : ['GetCurrentPosition'],
+    'DualRelay' : ['GetState'],
+    'IO4' : ['GetValue'],
+    'AnalogOut' : ['GetMode']
+}
+
 def get_changelog_version(path):
     r = re.compile('^(\d+)\.(\d+)\.(\d+):')
     last = None
@@ -252,6 +269,18 @@ Der Beispielcode ist Public Domain.
     copy_examples(copy_files, base_path)
     return examples
 
+# Absolute paths of the files written by the generators of this process,
+# generate_all.py clears it before a unit and stores it in its manifest
+output_files = []
+
+def record_output(name):
+    output_files.append(os.path.abspath(name))
+
+def open_output(name, mode='w'):
+    # Opens a generated file for writing and records it as output
+    record_output(name)
+    return file(name, mode)
+
 def find_examples(device, base_path, dirname, filename_prefix, filename_suffix):
     start_path = base_path.replace('/generators/' + dirname, '')
     board = '{0}-{1}'.format(device.get_underscore_name(), device.get_category().lower())
@@ -277,17 +306,132 @@ def copy_examples(copy_files, path):
         doc_dest = '{0}/{1}'.format(doc_path, copy_file[1])
         doc_src = copy_file[0]
         shutil.copy(doc_src, doc_dest)
+        record_output(doc_dest)
         print('   - {0}'.format(copy_file[1]))
 
+def make_temp_dir(name):
+    # Every job gets its own directory, so several generators and compilers
+    # can run at the same time. The root can be changed by setting TMPDIR
+    return tempfile.mkdtemp(prefix='tinkerforge_{0}_'.format(name))
+
 def make_zip(dirname, source_path, dest_path, version):
     zipname = 'tinkerforge_{0}_bindings_{1}_{2}_{3}.zip'.format(dirname, *version)
-    os.chdir(source_path)
-    args = ['/usr/bin/zip',
-            '-r',
-            zipname,
-            '.']
-    subprocess.call(args)
-    shutil.copy(zipname, dest_path)
+    print('  * Making {0}'.format(zipname))
+
+    # Written to a temporary file in the same directory and renamed, so an
+    # interrupted or failed run doesn't leave a truncated zip file behind
+    zip_path = os.path.join(dest_path, zipname)
+    fd, tmp_path = tempfile.mkstemp(prefix=zipname + '.', dir=dest_path)
+    os.close(fd)
+
+    try:
+        # Fixed order, timestamps and permissions make the zip file reproducible
+        z = zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED)
+
+        for root, subdirs, filenames in os.walk(source_path):
+            subdirs.sort()
+            filenames.sort()
+            prefix = os.path.relpath(root, source_path)
+
+            for subdir in subdirs:
+                info = zipfile.ZipInfo(os.path.normpath(os.path.join(prefix, subdir)) + '/', (1980, 1, 1, 0, 0, 0))
+                info.create_system = 3
+                info.external_attr = (0755 << 16) | 0x10
+                z.writestr(info, '')
+
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                info = zipfile.ZipInfo(os.path.normpath(os.path.join(prefix, filename)), (1980, 1, 1, 0, 0, 0))
+                info.create_system = 3
+                info.compress_type = zipfile.ZIP_DEFLATED
+
+                # Keep the scripts executable
+                if os.stat(path).st_mode & 0111:
+                    info.external_attr = 0755 << 16
+                else:
+                    info.external_attr = 0644 << 16
+
+                z.writestr(info, file(path, 'rb').read())
+
+        z.close()
+
+        # mkstemp creates the file readable for the owner only
+        os.chmod(tmp_path, 0644)
+        os.rename(tmp_path, zip_path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+def extract_zip(zip_path, dest_path):
+    z = zipfile.ZipFile(zip_path)
+    z.extractall(dest_path)
+    z.close()
+
+def find_files(path, suffix):
+    files = []
+    for dirname, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            if filename.endswith(suffix):
+                files.append(os.path.join(dirname, filename))
+
+    files.sort()
+    return files
+
+def run_command(command):
+    label, args, cwd = command
+    start = time.time()
+
+    try:
+        process = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        output = process.communicate()[0]
+        success = process.returncode == 0
+    except OSError as e:
+        output = '{0}: {1}\n'.format(args[0], e)
+        success = False
+
+    return (label, success, time.time() - start, output)
+
+def run_commands(commands, cwd, jobs=None):
+    # The work is done by external compilers, threads are enough to keep
+    # all cores busy. Each command is a (label, args) tuple
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    pool = ThreadPool(jobs)
+    results = []
+
+    for result in pool.imap_unordered(run_command, [(c[0], c[1], cwd) for c in commands]):
+        label, success, duration, output = result
+        print('compiling {0}'.format(label))
+        if len(output) > 0:
+            sys.stdout.write(output)
+        results.append(result)
+
+    pool.close()
+    pool.join()
+
+    return results
+
+def print_compile_summary(name, results):
+    width = max([len('Example')] + [len(r[0]) for r in results])
+    failed = 0
+    total = 0
+
+    print('\nResults for {0}:'.format(name))
+    print(' {0}  Result  Time'.format('Example'.ljust(width)))
+
+    for label, success, duration, output in sorted(results):
+        if success:
+            result = 'pass'
+        else:
+            result = 'FAIL'
+            failed += 1
+        total += duration
+        print(' {0}  {1}    {2:6.2f}s'.format(label.ljust(width), result, duration))
+
+    print(' {0} passed, {1} failed, {2:.2f}s compile time'.format(len(results) - failed, failed, total))
+
+    return failed == 0
 
 re_camel_case_to_space = re.compile('([A-Z][A-Z][a-z])|([a-z][A-Z])')
 
@@ -301,28 +445,92 @@ def underscore_to_headless_camel_case(name):
         ret += part[0].upper() + part[1:]
     return ret
 
-def generate(path, make_files):
+def get_config_path(path):
     path_list = path.split('/')
     path_list[-1] = 'configs'
-    path_config = '/'.join(path_list)
-    sys.path.append(path_config)
-    configs = os.listdir(path_config)
+    return '/'.join(path_list)
+
+def get_configs(path):
+    configs = []
+    for config in os.listdir(get_config_path(path)):
+        if config.endswith('_config.py'):
+            configs.append(config)
+    return configs
+
+def build_configs(path):
+    path_config = get_config_path(path)
+    if not path_config in sys.path:
+        sys.path.append(path_config)
+
+    common_packets = __import__('brick_commonconfig').common_packets
+    configs = {}
+
+    for config in get_configs(path):
+        com = __import__(config[:-3]).com
+        if 'brick_' in config and not com.has_key('common_included'):
+            com['packets'].extend(common_packets)
+            com['common_included'] = True
+
+        # Validates names and assigns the function IDs
+        Device(com)
+        configs[config] = com
+
+    return configs
+
+# Parsed configs by config path, filled once per process by load_configs.
+# Only the com dicts are cached, the generators still wrap them in Device
+# and Packet objects, which is cheap compared to importing the configs
+config_cache = {}
+
+def load_configs(path):
+    path_config = get_config_path(path)
+    if path_config in config_cache:
+        return config_cache[path_config]
+
+    # The parsed configs are persisted next to the configs directory and
+    # keyed by the hash of everything they are built from
+    inputs = [os.path.join(path_config, 'brick_commonconfig.py'), os.path.splitext(__file__)[0] + '.py']
+    for config in sorted(get_configs(path)):
+        inputs.append(os.path.join(path_config, config))
+
+    digest = hash_files(inputs)
+    path_cache = os.path.join(os.path.dirname(path_config), 'configs_cache.pickle')
+    configs = None
 
-    common_packets = []
     try:
-        configs.remove('brick_commonconfig.py')
-        common_packets = __import__('brick_commonconfig').common_packets
-    except:
+        cache = pickle.load(file(path_cache, 'rb'))
+        if cache['digest'] == digest:
+            configs = cache['configs']
+    except (IOError, EOFError, KeyError, pickle.UnpicklingError):
         pass
-    
-    for config in configs:
-        if config.endswith('_config.py'):
-            module = __import__(config[:-3])
-            print(" * {0}".format(config[:-10]))            
-            if 'brick_' in config and not module.com.has_key('common_included'):
-                module.com['packets'].extend(common_packets)
-                module.com['common_included'] = True
-            make_files(module.com, path)
+
+    if configs is None:
+        configs = build_configs(path)
+
+        # Write to a temporary file first, parallel runs might read the cache
+        path_tmp = '{0}.{1}'.format(path_cache, os.getpid())
+        f = file(path_tmp, 'wb')
+        pickle.dump({'digest': digest, 'configs': configs}, f, pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(path_tmp, path_cache)
+
+    config_cache[path_config] = configs
+    return config_cache[path_config]
+
+def load_config(path, config):
+    return load_configs(path)[config]
+
+def hash_files(filenames):
+    h = hashlib.sha1()
+    for filename in filenames:
+        h.update(os.path.basename(filename))
+        h.update(file(filename, 'rb').read())
+    return h.hexdigest()
+
+def generate(path, make_files):
+    for config in get_configs(path):
+        print(" * {0}".format(config[:-10]))
+        make_files(load_config(path, config), path)
 
 class Packet:
     def __init__(self, packet):
@@ -444,3 +652,62 @@ class Device:
 
     def get_callback_count(self):
         return len(self.callback_packets)
+
+    # (setter, getter) pairs like SetRange/GetRange, the getter returns
+    # exactly what the setter takes
+    def get_setter_getter_pairs(self):
+        functions = {}
+        for packet in self.function_packets:
+            functions[packet.get_camel_case_name()] = packet
+
+        pairs = []
+        for setter in self.function_packets:
+            name = setter.get_camel_case_name()
+            if not name.startswith('Set') or not 'Get' + name[3:] in functions:
+                continue
+
+            getter = functions['Get' + name[3:]]
+            if len(getter.get_elements('in')) > 0 or len(setter.get_elements('out')) > 0:
+                continue
+
+            if [e[1:3] for e in setter.get_elements('in')] != [e[1:3] for e in getter.get_elements('out')]:
+                continue
+
+            pairs.append((setter, getter))
+
+        return pairs
+
+    # Setters of the callback configuration, i.e. the period setters, the
+    # threshold setters and SetDebouncePeriod
+    def get_callback_setters(self):
+        setters = []
+        for packet in self.function_packets:
+            name = packet.get_camel_case_name()
+            if name == 'SetDebouncePeriod' or \
+               (name.startswith('Set') and name.endswith('CallbackThreshold')):
+                setters.append(packet)
+
+        for callback in self.callback_packets:
+            setter = self.get_period_setter(callback)
+            if setter is not None and not setter in setters:
+                setters.append(setter)
+
+        return sorted(setters, key=lambda packet: packet.get_function_id())
+
+    # (setter, getter) pairs where the getter can be answered with the
+    # value given to the setter, without asking the device
+    def get_cacheable_setter_getter_pairs(self):
+        volatile = volatile_getters.get(self.get_camel_case_name(), [])
+        return [pair for pair in self.get_setter_getter_pairs()
+                if not pair[1].get_camel_case_name() in volatile]
+
+    # The function that sets the period of a periodic callback, e.g.
+    # SetAccelerationPeriod or SetVoltageCallbackPeriod, None for others
+    def get_period_setter(self, callback):
+        name = callback.get_camel_case_name()
+        for packet in self.function_packets:
+            if packet.get_camel_case_name() in ('Set' + name + 'Period',
+                                                'Set' + name + 'CallbackPeriod'):
+                return packet
+
+        return None
@@ -3,6 +3,12 @@
 
 import sys
 import os
+import argparse
+
+parser = argparse.ArgumentParser(description='Compiles all examples')
+parser.add_argument('-j', '--jobs', type=int, default=None,
+                    help='number of examples compiled in parallel (default: number of CPUs)')
+args = parser.parse_args()
 
 path = os.getcwd()
 bindings = []
@@ -11,6 +17,7 @@ for d in os.listdir(path):
         if not d in ('configs', '.git'):
             bindings.append(d)
 
+failed = []
 for binding in bindings:
     if binding in ('tcpip', 'modbus'):
         continue
@@ -19,5 +26,9 @@ for binding in bindings:
     sys.path.append(path_binding)
     module = __import__('compile_{0}_examples'.format(binding))
     print("\nCompiling examples for {0}:".format(binding))
-    module.compile(path_binding)
+    if not module.compile(path_binding, args.jobs):
+        failed.append(binding)
 
+if len(failed) > 0:
+    print("\nCompiling failed for: {0}".format(', '.join(failed)))
+    sys.exit(1)
@@ -409,7 +409,7 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    csharp = file('{0}/{1}.cs'.format(directory, file_name), "w")
+    csharp = common.open_output('{0}/{1}.cs'.format(directory, file_name), "w")
     csharp.write(make_import())
     csharp.write(make_class())
     csharp.write(make_function_id_definitions())
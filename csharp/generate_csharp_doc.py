@@ -347,9 +347,9 @@ Alle folgend aufgelisteten Methoden sind Thread-sicher.
 
     return api[lang].format(ref, api_desc, api_str)
         
-def copy_examples_for_zip():
+def copy_examples_for_zip(generator_path):
     examples = common.find_examples(device, file_path, 'csharp', 'Example', '.cs')
-    dest = os.path.join('/tmp/generator/dll/examples/', 
+    dest = os.path.join(generator_path, 'dll/examples',
                         device.get_category(),
                         device.get_camel_case_name())
 
@@ -361,7 +361,9 @@ def copy_examples_for_zip():
 
 def make_files(com_new, directory):
     global device
+    global file_path
     device = common.Device(com_new)
+    file_path = directory
     file_name = '{0}_{1}_CSharp'.format(device.get_camel_case_name(), device.get_category())
     title = {
     'en': 'C# bindings',
@@ -372,47 +374,38 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    f = file('{0}/{1}.rst'.format(directory, file_name), "w")
+    f = common.open_output('{0}/{1}.rst'.format(directory, file_name), "w")
     f.write(common.make_rst_header(device, 'csharp', 'C#'))
     f.write(common.make_rst_summary(device, title[lang]))
     f.write(make_examples())
     f.write(make_api())
 
-    copy_examples_for_zip()
-
-def generate(path):
+def make_package(path):
+    global device
     global file_path
     file_path = path
-    path_list = path.split('/')
-    path_list[-1] = 'configs'
-    path_config = '/'.join(path_list)
-    sys.path.append(path_config)
-    configs = os.listdir(path_config)
 
     # Make temporary generator directory
-    if os.path.exists('/tmp/generator'):
-        shutil.rmtree('/tmp/generator/')
-    os.makedirs('/tmp/generator/dll/source/Tinkerforge')
-    os.chdir('/tmp/generator')
-
-    # Make bindings
-    for config in configs:
-        if config.endswith('_config.py'):
-            module = __import__(config[:-3])
-            print(" * {0}".format(config[:-10]))            
-            make_files(module.com, path)
-               
-    # Copy bindings and readme
-    for filename in glob.glob(path + '/bindings/*.cs'):
-        shutil.copy(filename, '/tmp/generator/dll/source/Tinkerforge')
-
-    shutil.copy(path + '/IPConnection.cs', '/tmp/generator/dll/source/Tinkerforge')
-    shutil.copy(path + '/changelog.txt', '/tmp/generator/dll')
-    shutil.copy(path + '/Readme.txt', '/tmp/generator/dll')
-
-    # Write AssemblyInfo
-    version = common.get_changelog_version(path)
-    file('/tmp/generator/dll/source/Tinkerforge/AssemblyInfo.cs', 'wb').write("""
+    generator_path = common.make_temp_dir('generator')
+    try:
+        os.makedirs(generator_path + '/dll/source/Tinkerforge')
+
+        # Copy examples
+        for config in common.get_configs(path):
+            device = common.Device(common.load_config(path, config))
+            copy_examples_for_zip(generator_path)
+
+        # Copy bindings and readme
+        for filename in glob.glob(path + '/bindings/*.cs'):
+            shutil.copy(filename, generator_path + '/dll/source/Tinkerforge')
+
+        shutil.copy(path + '/IPConnection.cs', generator_path + '/dll/source/Tinkerforge')
+        shutil.copy(path + '/changelog.txt', generator_path + '/dll')
+        shutil.copy(path + '/Readme.txt', generator_path + '/dll')
+
+        # Write AssemblyInfo
+        version = common.get_changelog_version(path)
+        file(generator_path + '/dll/source/Tinkerforge/AssemblyInfo.cs', 'wb').write("""
 using System.Reflection;
 using System.Runtime.CompilerServices;
 
@@ -427,17 +420,24 @@ using System.Runtime.CompilerServices;
 [assembly: AssemblyVersion("{0}.{1}.{2}.0")]
 """.format(*version))
 
-    # Make dll
-    args = ['/usr/bin/gmcs',
-            '/optimize',
-            '/target:library',
-            '/out:/tmp/generator/dll/Tinkerforge.dll',
-            '/doc:/tmp/generator/dll/Tinkerforge.xml',
-            '/tmp/generator/dll/source/Tinkerforge/*.cs']
-    subprocess.call(args)
-
-    # Make zip
-    common.make_zip('csharp', '/tmp/generator/dll', path, version)
+        # Make dll
+        args = ['/usr/bin/gmcs',
+                '/optimize',
+                '/target:library',
+                '/out:' + generator_path + '/dll/Tinkerforge.dll',
+                '/doc:' + generator_path + '/dll/Tinkerforge.xml',
+                generator_path + '/dll/source/Tinkerforge/*.cs']
+        subprocess.call(args)
+
+        # Make zip
+        common.make_zip('csharp', generator_path + '/dll', path, version)
+    finally:
+        # Remove temporary generator directory
+        shutil.rmtree(generator_path)
+
+def generate(path):
+    common.generate(path, make_files)
+    make_package(path)
 
 if __name__ == "__main__":
     generate(os.getcwd())
@@ -26,46 +26,40 @@ Boston, MA 02111-1307, USA.
 import sys
 import os
 import shutil
-import subprocess
 
 sys.path.append(os.path.split(os.getcwd())[0])
 import common
 
-def walker(arg, dirname, names):
-    for name in names:
-        if not name.endswith('.pas'):
-            continue
+def make_command(compiler_path, src):
+    args = ['/usr/bin/fpc',
+            '-Fu' + compiler_path + '/bindings',
+            '-l',
+            src]
 
-        src = os.path.join(dirname, name);
+    return (os.path.relpath(src, compiler_path), args)
 
-        args = ['/usr/bin/fpc',
-                '-Fu/tmp/compiler/bindings',
-                '-l',
-                src]
-
-        print 'compiling ' + src
-        subprocess.call(args)
-
-def compile(path):
+def compile(path, jobs=None):
     version = common.get_changelog_version(path)
     zipname = 'tinkerforge_delphi_bindings_{0}_{1}_{2}.zip'.format(*version)
 
     # Make temporary examples directory
-    if os.path.exists('/tmp/compiler'):
-        shutil.rmtree('/tmp/compiler/')
-    os.makedirs('/tmp/compiler')
-    os.chdir('/tmp/compiler')
-
-    shutil.copy(os.path.join(path, zipname), '/tmp/compiler/')
-
-    # unzip
-    print 'unpacking ' + zipname
-    args = ['/usr/bin/unzip',
-            os.path.join('/tmp/compiler', zipname)]
-    subprocess.call(args)
-
-    # compile
-    os.path.walk('/tmp/compiler/examples', walker, None)
+    compiler_path = common.make_temp_dir('compiler')
+    try:
+        # unzip
+        print 'unpacking ' + zipname
+        common.extract_zip(os.path.join(path, zipname), compiler_path)
+
+        # compile
+        commands = []
+        for src in common.find_files(os.path.join(compiler_path, 'examples'), '.pas'):
+            commands.append(make_command(compiler_path, src))
+
+        results = common.run_commands(commands, compiler_path, jobs)
+    finally:
+        # Remove temporary examples directory
+        shutil.rmtree(compiler_path)
+
+    return common.print_compile_summary('delphi', results)
 
 if __name__ == "__main__":
     compile(os.getcwd())
@@ -455,7 +455,7 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    pas = file('{0}/{1}.pas'.format(directory, file_name), 'w')
+    pas = common.open_output('{0}/{1}.pas'.format(directory, file_name), 'w')
     pas.write(make_unit_header())
     pas.write(make_function_id_definitions())
     pas.write(make_callback_id_definitions())
@@ -294,9 +294,9 @@ Alle folgend aufgelisteten Funktionen und Prozeduren sind Thread-sicher.
 
     return api[lang].format(ref, api_desc, api_str)
 
-def copy_examples_for_zip():
+def copy_examples_for_zip(generator_path):
     examples = common.find_examples(device, file_path, 'delphi', 'Example', '.pas')
-    dest = os.path.join('/tmp/generator/examples/',
+    dest = os.path.join(generator_path, 'examples',
                         device.get_category(),
                         device.get_camel_case_name())
 
@@ -308,7 +308,9 @@ def copy_examples_for_zip():
 
 def make_files(com_new, directory):
     global device
+    global file_path
     device = common.Device(com_new)
+    file_path = directory
     title = {
     'en': 'Delphi bindings',
     'de': 'Delphi Bindings'
@@ -320,51 +322,50 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    f = file('{0}/{1}.rst'.format(directory, file_name), "w")
+    f = common.open_output('{0}/{1}.rst'.format(directory, file_name), "w")
     f.write(common.make_rst_header(device, 'delphi', 'Delphi'))
     f.write(common.make_rst_summary(device, title[lang]))
     f.write(make_examples())
     f.write(make_api())
 
-    copy_examples_for_zip()
-
-def generate(path):
+def make_package(path):
+    global device
     global file_path
     file_path = path
-    path_list = path.split('/')
-    path_list[-1] = 'configs'
-    path_config = '/'.join(path_list)
-    sys.path.append(path_config)
-    configs = os.listdir(path_config)
 
     # Make temporary generator directory
-    if os.path.exists('/tmp/generator'):
-        shutil.rmtree('/tmp/generator/')
-    os.makedirs('/tmp/generator/bindings')
-    os.chdir('/tmp/generator/bindings')
-
-    for config in configs:
-        if config.endswith('_config.py'):
-            module = __import__(config[:-3])
-            print(" * {0}".format(config[:-10]))
-            make_files(module.com, path)
-
-    # Copy bindings and readme
-    for filename in glob.glob(path + '/bindings/*.pas'):
-        shutil.copy(filename, '/tmp/generator/bindings')
-
-    shutil.copy(path + '/Base58.pas', '/tmp/generator/bindings')
-    shutil.copy(path + '/BlockingQueue.pas', '/tmp/generator/bindings')
-    shutil.copy(path + '/Device.pas', '/tmp/generator/bindings')
-    shutil.copy(path + '/IPConnection.pas', '/tmp/generator/bindings')
-    shutil.copy(path + '/LEConverter.pas', '/tmp/generator/bindings')
-    shutil.copy(path + '/TimedSemaphore.pas', '/tmp/generator/bindings')
-    shutil.copy(path + '/changelog.txt', '/tmp/generator/')
-    shutil.copy(path + '/readme.txt', '/tmp/generator/')
-
-    # Make zip
-    version = common.get_changelog_version(path)
-    common.make_zip('delphi', '/tmp/generator', path, version)
+    generator_path = common.make_temp_dir('generator')
+    try:
+        os.makedirs(generator_path + '/bindings')
+
+        # Copy examples
+        for config in common.get_configs(path):
+            device = common.Device(common.load_config(path, config))
+            copy_examples_for_zip(generator_path)
+
+        # Copy bindings and readme
+        for filename in glob.glob(path + '/bindings/*.pas'):
+            shutil.copy(filename, generator_path + '/bindings')
+
+        shutil.copy(path + '/Base58.pas', generator_path + '/bindings')
+        shutil.copy(path + '/BlockingQueue.pas', generator_path + '/bindings')
+        shutil.copy(path + '/Device.pas', generator_path + '/bindings')
+        shutil.copy(path + '/IPConnection.pas', generator_path + '/bindings')
+        shutil.copy(path + '/LEConverter.pas', generator_path + '/bindings')
+        shutil.copy(path + '/TimedSemaphore.pas', generator_path + '/bindings')
+        shutil.copy(path + '/changelog.txt', generator_path + '/')
+        shutil.copy(path + '/readme.txt', generator_path + '/')
+
+        # Make zip
+        version = common.get_changelog_version(path)
+        common.make_zip('delphi', generator_path, path, version)
+    finally:
+        # Remove temporary generator directory
+        shutil.rmtree(generator_path)
+
+def generate(path):
+    common.generate(path, make_files)
+    make_package(path)
 
 if __name__ == "__main__":
     generate(os.getcwd())
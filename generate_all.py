@@ -3,8 +3,14 @@
 
 import sys
 import os
+import argparse
+import multiprocessing
+import json
+
+import common
 
 path = os.getcwd()
+path_manifest = '{0}/generate_manifest.json'.format(path)
 bindings = []
 for d in os.listdir(path):
     if os.path.isdir(d):
@@ -12,19 +18,199 @@ for d in os.listdir(path):
             bindings.append(d)
 
 for binding in bindings:
-    if binding in ('tcpip', 'modbus'):
-        continue
+    sys.path.append('{0}/{1}'.format(path, binding))
+
+def get_module(binding, artifact):
+    return __import__('generate_{0}_{1}'.format(binding, artifact))
+
+def get_extra_artifacts(binding):
+    # Generators besides bindings and doc, e.g. generate_python_simulator.py
+    artifacts = []
+    prefix = 'generate_{0}_'.format(binding)
+    for f in sorted(os.listdir('{0}/{1}'.format(path, binding))):
+        if f.startswith(prefix) and f.endswith('.py'):
+            artifact = f[len(prefix):-3]
+            if not artifact in ('bindings', 'doc'):
+                artifacts.append(artifact)
+
+    return artifacts
+
+def make_units():
+    units = []
+    configs = common.get_configs('{0}/configs'.format(path))
+
+    for binding in bindings:
+        if binding in ('tcpip', 'modbus'):
+            continue
+
+        for config in configs:
+            units.append(('bindings', binding, config))
+
+    for binding in bindings:
+        for config in configs:
+            units.append(('doc', binding, config))
+
+    for binding in bindings:
+        for artifact in get_extra_artifacts(binding):
+            for config in configs:
+                units.append((artifact, binding, config))
+
+    return units
+
+def get_unit_key(unit):
+    artifact, binding, config = unit
+    return '{0}/{1}/{2}'.format(binding, artifact, config)
 
+def get_unit_inputs(unit):
+    artifact, binding, config = unit
     path_binding = '{0}/{1}'.format(path, binding)
-    sys.path.append(path_binding)
-    module = __import__('generate_{0}_bindings'.format(binding))
-    print("\nGenerating bindings for {0}:".format(binding))
-    module.common.generate(path_binding, module.make_files)
+    path_config = common.get_config_path(path_binding)
+    generator = 'generate_{0}_{1}.py'.format(binding, artifact)
 
-for binding in bindings:
+    inputs = ['{0}/common.py'.format(path),
+              '{0}/{1}'.format(path_config, config)]
+
+    if 'brick_' in config:
+        inputs.append('{0}/brick_commonconfig.py'.format(path_config))
+
+    # Only source files: the generator itself, the <binding>_common.py, the
+    # changelog and readme and the ip_connection or other runtime sources
+    # that end up in the package. Generated files like the zips that
+    # make_package writes next to them must not change the hash
+    for f in sorted(os.listdir(path_binding)):
+        if not os.path.isfile('{0}/{1}'.format(path_binding, f)):
+            continue
+
+        if f == generator or is_source_input(binding, f):
+            inputs.append('{0}/{1}'.format(path_binding, f))
+
+    return inputs
+
+def is_source_input(binding, f):
+    name, ext = os.path.splitext(f.lower())
+
+    if name in ('changelog', 'readme') and ext == '.txt':
+        return True
+
+    if ext == '.py':
+        return name.startswith('ip_connection') or name == binding + '_common'
+
+    return ext in ('.c', '.h', '.cs', '.pas', '.java', '.php', '.rb')
+
+def get_unit_hash(unit):
+    return common.hash_files(get_unit_inputs(unit))
+
+def is_unit_current(unit, digest, manifest):
+    # The manifest maps a unit to {'digest': ..., 'outputs': [...]}, a unit
+    # is regenerated if one of its output files is missing
+    entry = manifest.get(get_unit_key(unit))
+    if not isinstance(entry, dict) or entry.get('digest') != digest:
+        return False
+
+    for output in entry['outputs']:
+        if not os.path.exists('{0}/{1}'.format(path, output)):
+            return False
+
+    return len(entry['outputs']) > 0
+
+def read_manifest():
+    try:
+        return json.load(file(path_manifest))
+    except (IOError, ValueError):
+        return {}
+
+def write_manifest(manifest):
+    json.dump(manifest, file(path_manifest, 'wb'), indent=1, sort_keys=True)
+
+def make_output_dirs(units):
+    # The generators create their output directory if it's missing, this
+    # races between the workers of the pool, so create them all up front
+    for artifact, binding in sorted(set([(unit[0], unit[1]) for unit in units])):
+        directory = '{0}/{1}/{2}'.format(path, binding, artifact)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+def run_unit(unit):
+    artifact, binding, config = unit
     path_binding = '{0}/{1}'.format(path, binding)
-    sys.path.append(path_binding)
-    module = __import__('generate_{0}_doc'.format(binding))
-    print("\nGenerating documentation for {0}:".format(binding))
-    module.generate(path_binding)
 
+    print(" * {0} {1}: {2}".format(binding, artifact, config[:-10]))
+
+    # Returns the files the generator recorded with common.open_output and
+    # common.record_output, relative to path. Every worker runs one unit at
+    # a time, so the module global is safe here
+    del common.output_files[:]
+    get_module(binding, artifact).make_files(common.load_config(path_binding, config), path_binding)
+
+    return sorted(set([os.path.relpath(name, path) for name in common.output_files]))
+
+def run_package(binding):
+    print("\nPackaging {0}:".format(binding))
+    get_module(binding, 'doc').make_package('{0}/{1}'.format(path, binding))
+
+def get_packages(manifest, force):
+    packages = []
+    for binding in bindings:
+        if not hasattr(get_module(binding, 'doc'), 'make_package'):
+            continue
+
+        # A package is rebuilt if any of the units of its language changed
+        key = '{0}/package'.format(binding)
+        digests = []
+        for unit_key in sorted(manifest.keys()):
+            entry = manifest[unit_key]
+            if unit_key.startswith(binding + '/') and isinstance(entry, dict):
+                digests.append(entry['digest'])
+        digest = '/'.join(digests)
+
+        if force or manifest.get(key) != digest:
+            packages.append((binding, key, digest))
+
+    return packages
+
+def run(function, items, jobs):
+    if jobs > 1:
+        pool = multiprocessing.Pool(jobs)
+        results = pool.map(function, items, 1)
+        pool.close()
+        pool.join()
+        return results
+    else:
+        return [function(item) for item in items]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generates all bindings and documentations')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='number of worker processes for (language, device, artifact) units')
+    parser.add_argument('-f', '--force', action='store_true',
+                        help='regenerate everything, ignoring the manifest')
+    args = parser.parse_args()
+
+    manifest = read_manifest()
+    units = []
+    digests = []
+    for unit in make_units():
+        digest = get_unit_hash(unit)
+        if args.force or not is_unit_current(unit, digest, manifest):
+            units.append(unit)
+            digests.append(digest)
+
+    # Parse the configs once, the workers inherit or load the result
+    common.load_configs('{0}/configs'.format(path))
+
+    print("\nGenerating bindings and documentation ({0} units changed):".format(len(units)))
+    make_output_dirs(units)
+    outputs = run(run_unit, units, args.jobs)
+
+    for unit, digest, unit_outputs in zip(units, digests, outputs):
+        manifest[get_unit_key(unit)] = {'digest': digest, 'outputs': unit_outputs}
+    write_manifest(manifest)
+
+    # Every package is staged in its own temporary directory, so the
+    # languages can be packaged in parallel as well
+    packages = get_packages(manifest, args.force)
+    run(run_package, [package[0] for package in packages], args.jobs)
+
+    for binding, key, digest in packages:
+        manifest[key] = digest
+    write_manifest(manifest)
@@ -532,7 +532,7 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    java = file('{0}/{1}.java'.format(directory, file_name), "w")
+    java = common.open_output('{0}/{1}.java'.format(directory, file_name), "w")
     java.write(make_import())
     java.write(make_class())
     java.write(make_function_id_definitions())
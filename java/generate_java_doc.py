@@ -464,9 +464,9 @@ Alle folgend aufgelisteten Methoden sind Thread-sicher.
 
     return api[lang].format(ref, api_desc, api_str)
         
-def copy_examples_for_zip():
+def copy_examples_for_zip(generator_path):
     examples = common.find_examples(device, file_path, 'java', 'Example', '.java')
-    dest = os.path.join('/tmp/generator/jar/examples/', 
+    dest = os.path.join(generator_path, 'jar/examples',
                         device.get_category(),
                         device.get_camel_case_name())
 
@@ -478,7 +478,9 @@ def copy_examples_for_zip():
 
 def make_files(com_new, directory):
     global device
+    global file_path
     device = common.Device(com_new)
+    file_path = directory
     file_name = '{0}_{1}_Java'.format(device.get_camel_case_name(), device.get_category())
     title = {
     'en': 'Java bindings',
@@ -489,68 +491,65 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    f = file('{0}/{1}.rst'.format(directory, file_name), "w")
+    f = common.open_output('{0}/{1}.rst'.format(directory, file_name), "w")
     f.write(common.make_rst_header(device, 'java', 'Java'))
     f.write(common.make_rst_summary(device, title[lang]))
     f.write(make_examples())
     f.write(make_api())
 
-    copy_examples_for_zip()
-
-def generate(path):
+def make_package(path):
+    global device
     global file_path
     file_path = path
-    path_list = path.split('/')
-    path_list[-1] = 'configs'
-    path_config = '/'.join(path_list)
-    sys.path.append(path_config)
-    configs = os.listdir(path_config)
 
     # Make temporary generator directory
-    if os.path.exists('/tmp/generator'):
-        shutil.rmtree('/tmp/generator/')
-    os.makedirs('/tmp/generator/jar/source/com/tinkerforge')
-    os.chdir('/tmp/generator')
-
-    # Make bindings
-    for config in configs:
-        if config.endswith('_config.py'):
-            module = __import__(config[:-3])
-            print(" * {0}".format(config[:-10]))            
-            make_files(module.com, path)
-
-    # Copy bindings and readme
-    for filename in glob.glob(path + '/bindings/*.java'):
-        shutil.copy(filename, '/tmp/generator/jar/source/com/tinkerforge')
-
-    shutil.copy(path + '/Device.java', '/tmp/generator/jar/source/com/tinkerforge')
-    shutil.copy(path + '/IPConnection.java', '/tmp/generator/jar/source/com/tinkerforge')
-    shutil.copy(path + '/changelog.txt', '/tmp/generator/jar')
-    shutil.copy(path + '/Readme.txt', '/tmp/generator/jar')
-
-    # Make Manifest
-    version = common.get_changelog_version(path)
-    file('/tmp/generator/manifest.txt', 'wb').write('Bindings-Version: {0}.{1}.{2}\n'.format(*version))
-
-    # Make jar
-    args = ['/usr/bin/javac /tmp/generator/jar/source/com/tinkerforge/*.java']
-    subprocess.call(args, shell=True)
-
-    os.chdir('/tmp/generator/jar/source')
-    args = ['/usr/bin/jar ' +
-            'cfm ' +
-            '/tmp/generator/jar/Tinkerforge.jar ' +
-            '/tmp/generator/manifest.txt ' +
-            'com']
-    subprocess.call(args, shell=True)
-
-    # Remove class
-    for f in os.listdir('/tmp/generator/jar/source/com/tinkerforge/'):
-        if f.endswith('.class'):
-            os.remove('/tmp/generator/jar/source/com/tinkerforge/' + f)
-
-    # Make zip
-    common.make_zip('java', '/tmp/generator/jar', path, version)
+    generator_path = common.make_temp_dir('generator')
+    try:
+        os.makedirs(generator_path + '/jar/source/com/tinkerforge')
+
+        # Copy examples
+        for config in common.get_configs(path):
+            device = common.Device(common.load_config(path, config))
+            copy_examples_for_zip(generator_path)
+
+        # Copy bindings and readme
+        for filename in glob.glob(path + '/bindings/*.java'):
+            shutil.copy(filename, generator_path + '/jar/source/com/tinkerforge')
+
+        shutil.copy(path + '/Device.java', generator_path + '/jar/source/com/tinkerforge')
+        shutil.copy(path + '/IPConnection.java', generator_path + '/jar/source/com/tinkerforge')
+        shutil.copy(path + '/changelog.txt', generator_path + '/jar')
+        shutil.copy(path + '/Readme.txt', generator_path + '/jar')
+
+        # Make Manifest
+        version = common.get_changelog_version(path)
+        file(generator_path + '/manifest.txt', 'wb').write('Bindings-Version: {0}.{1}.{2}\n'.format(*version))
+
+        # Make jar
+        args = ['/usr/bin/javac ' + generator_path + '/jar/source/com/tinkerforge/*.java']
+        subprocess.call(args, shell=True)
+
+        args = ['/usr/bin/jar ' +
+                'cfm ' +
+                generator_path + '/jar/Tinkerforge.jar ' +
+                generator_path + '/manifest.txt ' +
+                'com']
+        subprocess.call(args, shell=True, cwd=generator_path + '/jar/source')
+
+        # Remove class
+        for f in os.listdir(generator_path + '/jar/source/com/tinkerforge/'):
+            if f.endswith('.class'):
+                os.remove(generator_path + '/jar/source/com/tinkerforge/' + f)
+
+        # Make zip
+        common.make_zip('java', generator_path + '/jar', path, version)
+    finally:
+        # Remove temporary generator directory
+        shutil.rmtree(generator_path)
+
+def generate(path):
+    common.generate(path, make_files)
+    make_package(path)
 
 if __name__ == "__main__":
     generate(os.getcwd())
@@ -26,7 +26,6 @@ Boston, MA 02111-1307, USA.
 
 import sys
 import os
-import shutil
 import subprocess
 
 sys.path.append(os.path.split(os.getcwd())[0])
@@ -238,31 +237,13 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    f = file('{0}/{1}.rst'.format(directory, file_name), "w")
+    f = common.open_output('{0}/{1}.rst'.format(directory, file_name), "w")
     f.write(common.make_rst_header(device, 'modbus', 'Modbus'))
     f.write(common.make_rst_summary(device, title[lang]))
     f.write(make_api())
 
 def generate(path):
-    global file_path
-    file_path = path
-    path_list = path.split('/')
-    path_list[-1] = 'configs'
-    path_config = '/'.join(path_list)
-    sys.path.append(path_config)
-    configs = os.listdir(path_config)
-
-    # Make temporary generator directory
-    if os.path.exists('/tmp/generator'):
-        shutil.rmtree('/tmp/generator/')
-    os.makedirs('/tmp/generator')
-    os.chdir('/tmp/generator')
-
-    for config in configs:
-        if config.endswith('_config.py'):
-            module = __import__(config[:-3])
-            print(" * {0}".format(config[:-10]))
-            make_files(module.com, path)
+    common.generate(path, make_files)
 
 if __name__ == "__main__":
     generate(os.getcwd())
@@ -236,8 +236,11 @@ class IPConnection
     const FUNCTION_ENUMERATE = 254;
     const FUNCTION_ENUMERATE_CALLBACK = 253;
 
+    const PUMP_MAX_RECEIVES = 64;
+
     private $socket = FALSE;
     private $pendingData = '';
+    private $pendingOffset = 0;
     private $devices = array();
     private $pendingAddDevice = NULL;
     private $enumerateCallback = NULL;
@@ -308,8 +311,8 @@ class IPConnection
      * It should be possible to implement "plug 'n play" functionality with this
      * (as is done in Brick Viewer).
      *
-     * You need to call IPConnection::dispatchCallbacks() in order to receive
-     * the callbacks. The recommended dispatch time is 2.5s.
+     * You need to call IPConnection::dispatchCallbacks() or IPConnection::pump()
+     * in order to receive the callbacks. The recommended dispatch time is 2.5s.
      *
      * @param callable $callback
      *
@@ -382,6 +385,67 @@ class IPConnection
         }
     }
 
+    /**
+     * Dispatches all callbacks that have already arrived and returns without
+     * waiting for more. Call this method regularly if you want to handle
+     * incoming callbacks in between other work, instead of blocking in
+     * IPConnection::dispatchCallbacks(). At most PUMP_MAX_RECEIVES reads
+     * of up to 8192 bytes are handled per call, so a fast stream of
+     * callbacks can't keep it from returning.
+     *
+     * If the connection is lost the IPConnection is destroyed and an
+     * exception is thrown.
+     *
+     * @return void
+     */
+    public function pump()
+    {
+        if ($this->socket === FALSE) {
+            throw new \Exception('Not connected');
+        }
+
+        // Dispatch all pending callbacks that were received by getters
+        foreach ($this->devices as $device) {
+            $device->dispatchCallbacks();
+        }
+
+        for ($i = 0; $i < self::PUMP_MAX_RECEIVES; $i++) {
+            if ($this->socket === FALSE) {
+                // Destroyed by a callback
+                break;
+            }
+
+            $read = array($this->socket);
+            $write = NULL;
+            $except = NULL;
+            $changed = @socket_select($read, $write, $except, 0, 0);
+
+            if ($changed === FALSE) {
+                throw new \Exception('Could not receive response: ' .
+                                     socket_strerror(socket_last_error($this->socket)));
+            } else if ($changed == 0) {
+                // Nothing left to read
+                break;
+            }
+
+            $data = '';
+            $length = @socket_recv($this->socket, $data, 8192, 0);
+
+            if ($length === FALSE) {
+                $error = socket_strerror(socket_last_error($this->socket));
+
+                $this->destroy();
+                throw new \Exception('Could not receive response: ' . $error);
+            } else if ($length == 0) {
+                $this->destroy();
+                throw new \Exception('Socket disconnected by Brick Daemon');
+            }
+
+            $this->pendingData .= $data;
+            $this->handlePendingData(TRUE);
+        }
+    }
+
     /**
      * @internal
      */
@@ -425,25 +489,7 @@ class IPConnection
                 $before = microtime(true);
 
                 $this->pendingData .= $data;
-
-                while (TRUE) {
-                    if (strlen($this->pendingData) < 4) {
-                        // Wait for complete header
-                        break;
-                    }
-
-                    $header = unpack('CstackID/CfunctionID/vlength', $this->pendingData);
-                    $length = $header['length'];
-
-                    if (strlen($this->pendingData) < $length) {
-                        // Wait for complete packet
-                        break;
-                    }
-
-                    $packet = substr($this->pendingData, 0, $length);
-                    $this->pendingData = substr($this->pendingData, $length);
-                    $this->handleResponse($packet, $directCallbackDispatch);
-                }
+                $this->handlePendingData($directCallbackDispatch);
 
                 $after = microtime(true);
 
@@ -491,6 +537,51 @@ class IPConnection
         }
     }
 
+    /**
+     * @internal
+     */
+    private function handlePendingData($directCallbackDispatch)
+    {
+        // Complete packets are taken from pendingData at pendingOffset, the
+        // remaining data is only moved to the front once at the end. Both are
+        // members, because a callback can call a getter that receives again
+        while (TRUE) {
+            $available = strlen($this->pendingData) - $this->pendingOffset;
+
+            if ($available < 4) {
+                // Wait for complete header
+                break;
+            }
+
+            $length = ord($this->pendingData[$this->pendingOffset + 2]) |
+                      (ord($this->pendingData[$this->pendingOffset + 3]) << 8);
+
+            if ($length < 4) {
+                // A packet that doesn't even cover its header would never be
+                // consumed, a TCP stream can't be resynchronized
+                $this->pendingData = '';
+                $this->pendingOffset = 0;
+
+                $this->destroy();
+                throw new \Exception('Received packet with invalid length ' . $length);
+            }
+
+            if ($available < $length) {
+                // Wait for complete packet
+                break;
+            }
+
+            $packet = substr($this->pendingData, $this->pendingOffset, $length);
+            $this->pendingOffset += $length;
+            $this->handleResponse($packet, $directCallbackDispatch);
+        }
+
+        if ($this->pendingOffset > 0) {
+            $this->pendingData = (string)substr($this->pendingData, $this->pendingOffset);
+            $this->pendingOffset = 0;
+        }
+    }
+
     /**
      * @internal
      */
@@ -489,7 +489,7 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    php = file('{0}/{1}.php'.format(directory, file_name), "w")
+    php = common.open_output('{0}/{1}.php'.format(directory, file_name), "w")
     php.write("<?php\n\n")
     php.write(make_import())
     php.write(make_class())
@@ -332,9 +332,9 @@ API
 
     return api[lang].format(ref, api_desc, api_str)
 
-def copy_examples_for_zip():
+def copy_examples_for_zip(generator_path):
     examples = common.find_examples(device, file_path, 'php', 'Example', '.php')
-    dest = os.path.join('/tmp/generator/pear/examples/',
+    dest = os.path.join(generator_path, 'pear/examples',
                         device.get_category().lower(),
                         device.get_underscore_name())
 
@@ -346,7 +346,9 @@ def copy_examples_for_zip():
 
 def make_files(com_new, directory):
     global device
+    global file_path
     device = common.Device(com_new)
+    file_path = directory
     file_name = '{0}_{1}_PHP'.format(device.get_camel_case_name(), device.get_category())
     title = {
     'en': 'PHP bindings',
@@ -357,50 +359,41 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    f = file('{0}/{1}.rst'.format(directory, file_name), "w")
+    f = common.open_output('{0}/{1}.rst'.format(directory, file_name), "w")
     f.write(common.make_rst_header(device, 'php', 'PHP'))
     f.write(common.make_rst_summary(device, title[lang]))
     f.write(make_examples())
     f.write(make_api())
 
-    copy_examples_for_zip()
-
-def generate(path):
+def make_package(path):
+    global device
     global file_path
     file_path = path
-    path_list = path.split('/')
-    path_list[-1] = 'configs'
-    path_config = '/'.join(path_list)
-    sys.path.append(path_config)
-    configs = os.listdir(path_config)
 
     # Make temporary generator directory
-    if os.path.exists('/tmp/generator'):
-        shutil.rmtree('/tmp/generator/')
-    os.makedirs('/tmp/generator/pear/source/Tinkerforge')
-    os.chdir('/tmp/generator')
-
-    # Make bindings
-    for config in configs:
-        if config.endswith('_config.py'):
-            module = __import__(config[:-3])
-            print(" * {0}".format(config[:-10]))
-            make_files(module.com, path)
-
-    # Copy bindings and readme
-    package_files = ['<file name="Tinkerforge/IPConnection.php" role="php" />']
-    for filename in glob.glob(path + '/bindings/*.php'):
-        shutil.copy(filename, '/tmp/generator/pear/source/Tinkerforge')
-        package_files.append('<file name="Tinkerforge/{0}" role="php" />'.format(os.path.basename(filename)))
-
-    shutil.copy(path + '/IPConnection.php', '/tmp/generator/pear/source/Tinkerforge')
-    shutil.copy(path + '/changelog.txt', '/tmp/generator/pear')
-    shutil.copy(path + '/readme.txt', '/tmp/generator/pear')
-
-    # Write package.xml
-    version = common.get_changelog_version(path)
-    date = datetime.datetime.now().strftime("%Y-%m-%d")
-    file('/tmp/generator/pear/source/package.xml', 'wb').write("""<?xml version="1.0" encoding="UTF-8"?>
+    generator_path = common.make_temp_dir('generator')
+    try:
+        os.makedirs(generator_path + '/pear/source/Tinkerforge')
+
+        # Copy examples
+        for config in common.get_configs(path):
+            device = common.Device(common.load_config(path, config))
+            copy_examples_for_zip(generator_path)
+
+        # Copy bindings and readme
+        package_files = ['<file name="Tinkerforge/IPConnection.php" role="php" />']
+        for filename in glob.glob(path + '/bindings/*.php'):
+            shutil.copy(filename, generator_path + '/pear/source/Tinkerforge')
+            package_files.append('<file name="Tinkerforge/{0}" role="php" />'.format(os.path.basename(filename)))
+
+        shutil.copy(path + '/IPConnection.php', generator_path + '/pear/source/Tinkerforge')
+        shutil.copy(path + '/changelog.txt', generator_path + '/pear')
+        shutil.copy(path + '/readme.txt', generator_path + '/pear')
+
+        # Write package.xml
+        version = common.get_changelog_version(path)
+        date = datetime.datetime.now().strftime("%Y-%m-%d")
+        file(generator_path + '/pear/source/package.xml', 'wb').write("""<?xml version="1.0" encoding="UTF-8"?>
 <package packagerversion="1.9.0" version="2.0" xmlns="http://pear.php.net/dtd/package-2.0">
  <name>Tinkerforge</name>
  <uri>http://download.tinkerforge.com/bindings/php/pear/Tinkerforge-{2}.{3}.{4}</uri>
@@ -442,20 +435,26 @@ def generate(path):
 </package>
 """.format(date, '\n    '.join(package_files), *version))
 
-    # Make PEAR package
-    os.chdir('/tmp/generator/pear/source')
-    args = ['/usr/bin/pear',
-            'package',
-            'package.xml']
-    subprocess.call(args)
+        # Make PEAR package
+        args = ['/usr/bin/pear',
+                'package',
+                'package.xml']
+        subprocess.call(args, cwd=generator_path + '/pear/source')
+
+        # Remove build stuff
+        shutil.move(generator_path + '/pear/source/Tinkerforge-{0}.{1}.{2}.tgz'.format(*version),
+                    generator_path + '/pear/Tinkerforge.tgz')
+        os.remove(generator_path + '/pear/source/package.xml')
 
-    # Remove build stuff
-    shutil.move('/tmp/generator/pear/source/Tinkerforge-{0}.{1}.{2}.tgz'.format(*version),
-                '/tmp/generator/pear/Tinkerforge.tgz')
-    os.remove('/tmp/generator/pear/source/package.xml')
+        # Make zip
+        common.make_zip('php', generator_path + '/pear', path, version)
+    finally:
+        # Remove temporary generator directory
+        shutil.rmtree(generator_path)
 
-    # Make zip
-    common.make_zip('php', '/tmp/generator/pear', path, version)
+def generate(path):
+    common.generate(path, make_files)
+    make_package(path)
 
 if __name__ == "__main__":
     generate(os.getcwd())
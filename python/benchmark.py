@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bindings Benchmark
+Copyright (C) 2012 Matthias Bolte <matthias@tinkerforge.com>
+
+benchmark.py: Measures the Python bindings against a simulated Brick Daemon
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+
+Runs the modules in benchmark/, which are created by
+generate_python_benchmark.py, against brickd_simulator.py. The bindings in
+bindings/ and ip_connection.py are copied into a temporary tinkerforge
+package first, so the current output of the generators is measured.
+
+For every function the request encoding, the response decoding and the
+duration of a call are measured, for every callback the decoding and the
+number of callbacks per second that pass the receive path and a callback
+thread. All durations are in microseconds. The results are written as JSON.
+
+Usage: benchmark.py [--output benchmark.json] [--iterations 1000] [brick_imu ...]
+"""
+
+from threading import Event
+import argparse
+import datetime
+import platform
+import tempfile
+import timeit
+import shutil
+import struct
+import glob
+import json
+import sys
+import os
+
+from brickd_simulator import Simulator, UID_OFFSET, base58encode, load_modules
+
+timer = timeit.default_timer
+
+def make_package(bindings, directory):
+    package = os.path.join(directory, 'tinkerforge')
+    os.makedirs(package)
+
+    files = glob.glob(os.path.join(bindings, '*.py'))
+    files.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ip_connection.py'))
+
+    for f in files:
+        # The asyncio variants don't compile with Python 2
+        if not f.endswith('_async.py'):
+            shutil.copy(f, package)
+
+    open(os.path.join(package, '__init__.py'), 'w').close()
+
+def measure(function, iterations):
+    # Returns the mean duration of a call in microseconds
+    start = timer()
+    for i in range(iterations):
+        function()
+    return (timer() - start) / iterations * 1000000
+
+def summarize(durations):
+    durations = sorted(durations)
+    return {
+        'mean': sum(durations) / len(durations) * 1000000,
+        'p50': durations[len(durations) // 2] * 1000000,
+        'p99': durations[min(len(durations) * 99 // 100, len(durations) - 1)] * 1000000,
+        'max': durations[-1] * 1000000
+    }
+
+def benchmark_functions(module, device, iterations, calls):
+    results = {}
+
+    for name, args, form, form_ret in module.functions:
+        result = {}
+        result['encode'] = measure(lambda: form.pack(1, 1, args), iterations)
+
+        if form_ret.size > 0:
+            payload = b'\0' * form_ret.size
+            result['decode'] = measure(lambda: form_ret.unpack(payload), iterations)
+
+        # Functions without response only take the time to send the request
+        method = getattr(device, name)
+        durations = []
+        try:
+            for i in range(calls):
+                start = timer()
+                method(*args)
+                durations.append(timer() - start)
+        except Exception as e:
+            result['error'] = str(e)
+
+        if len(durations) > 0:
+            if form_ret.size > 0:
+                result['round_trip'] = summarize(durations)
+            else:
+                result['call'] = summarize(durations)
+
+        results[name] = result
+
+    return results
+
+def benchmark_callbacks(module, ipcon, device, iterations):
+    results = {}
+
+    for name, callback_id, form in module.callbacks:
+        result = {}
+        payload = b'\0' * form.size
+        result['decode'] = measure(lambda: form.unpack(payload), iterations)
+
+        # Callbacks are fed into the receive path directly, the socket is
+        # covered by the round-trips
+        packet = struct.pack('<BBH', device.stack_id, callback_id, form.size + 4) + payload
+        count = [0]
+        done = Event()
+
+        def callback(*args):
+            count[0] += 1
+            if count[0] == iterations:
+                done.set()
+
+        device.register_callback(callback_id, callback)
+
+        start = timer()
+        for i in range(iterations):
+            ipcon.handle_response(packet)
+        done.wait(10)
+        duration = timer() - start
+
+        del device.registered_callbacks[callback_id]
+
+        if done.is_set():
+            result['dispatch_per_second'] = iterations / duration
+        else:
+            result['error'] = 'Only {0} of {1} callbacks arrived'.format(count[0], iterations)
+
+        results[name] = result
+
+    return results
+
+def run(modules, iterations, calls, latency):
+    from tinkerforge.ip_connection import IPConnection
+
+    simulator = Simulator(load_modules(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulator'),
+                                       [module.simulator for module in modules]),
+                          latency)
+    port = simulator.start('localhost', 0)
+    ipcon = IPConnection('localhost', port)
+
+    try:
+        devices = [module.device_class(base58encode(UID_OFFSET + i + 1)) for i, module in enumerate(modules)]
+        for device, error in zip(devices, ipcon.add_devices(devices)):
+            if error is not None:
+                raise error
+
+        results = {}
+        for module, device in zip(modules, devices):
+            print(" * {0}".format(module.name))
+            results[module.name] = {
+                'functions': benchmark_functions(module, device, iterations, calls),
+                'callbacks': benchmark_callbacks(module, ipcon, device, iterations)
+            }
+
+        return results
+    finally:
+        ipcon.destroy()
+        simulator.stop()
+
+if __name__ == "__main__":
+    path = os.path.dirname(os.path.abspath(__file__))
+
+    parser = argparse.ArgumentParser(description='Benchmarks the Python bindings against a simulated Brick Daemon')
+    parser.add_argument('--output', default='benchmark.json')
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help='number of encodings, decodings and callbacks')
+    parser.add_argument('--calls', type=int, default=100,
+                        help='number of calls per function')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='delay of every simulated packet in milliseconds')
+    parser.add_argument('--bindings', default=os.path.join(path, 'bindings'))
+    parser.add_argument('devices', nargs='*',
+                        help="devices like 'brick_imu', all if none are given")
+    args = parser.parse_args()
+
+    names = args.devices
+    if len(names) == 0:
+        names = sorted([os.path.basename(f)[len('benchmark_'):-3]
+                        for f in glob.glob(os.path.join(path, 'benchmark', 'benchmark_*.py'))])
+
+    directory = tempfile.mkdtemp()
+    try:
+        make_package(args.bindings, directory)
+        sys.path.insert(0, directory)
+        sys.path.insert(0, os.path.join(path, 'benchmark'))
+
+        modules = [__import__('benchmark_' + name) for name in names]
+        results = {
+            'python': platform.python_version(),
+            'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'iterations': args.iterations,
+            'calls': args.calls,
+            'latency': args.latency,
+            'devices': run(modules, args.iterations, args.calls, args.latency / 1000.0)
+        }
+    finally:
+        shutil.rmtree(directory)
+
+    f = open(args.output, 'w')
+    try:
+        json.dump(results, f, indent=1, sort_keys=True)
+    finally:
+        f.close()
+
+    print("Results written to {0}".format(args.output))
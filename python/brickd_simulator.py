@@ -0,0 +1,419 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Simulated Brick Daemon
+Copyright (C) 2012 Matthias Bolte <matthias@tinkerforge.com>
+
+brickd_simulator.py: TCP server that simulates Bricks and Bricklets
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+
+The devices are described by the modules in simulator/, which are created
+by generate_python_simulator.py. Every function answers with a correctly
+sized response, getters return the last value given to their setter and
+periodic callbacks are sent with the period set by their period setter.
+
+Usage: brickd_simulator.py [--port 4223] [--latency 0] brick_imu bricklet_temperature:10
+"""
+
+from threading import Thread, Lock, Condition
+from collections import deque
+import argparse
+import struct
+import socket
+import time
+import sys
+import os
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+FUNCTION_GET_STACK_ID = 255
+FUNCTION_ENUMERATE = 254
+FUNCTION_ENUMERATE_CALLBACK = 253
+
+BROADCAST_ADDRESS = 0
+UID_OFFSET = 100000
+MAX_DEVICES = 255 # stack IDs are a single byte, 0 is the broadcast address
+
+BASE58 = '123456789abcdefghijkmnopqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ'
+def base58encode(value):
+    encoded = ''
+    while value >= 58:
+        div, mod = divmod(value, 58)
+        encoded = BASE58[mod] + encoded
+        value = div
+    encoded = BASE58[value] + encoded
+    return encoded
+
+def get_size(form):
+    return struct.calcsize('<' + form)
+
+class SimulatedDevice:
+    def __init__(self, module, uid, stack_id):
+        self.module = module
+        self.uid = uid
+        self.stack_id = stack_id
+        self.values = {} # function ID -> last request payload
+        self.periods = {} # callback ID -> period in seconds
+        self.due = {} # callback ID -> time of the next callback
+        self.period_setters = {} # function ID -> callback ID
+
+        for callback_id, (form, setter) in module.callbacks.items():
+            if setter is not None:
+                self.period_setters[setter] = callback_id
+
+    def get_name(self):
+        # The name includes a hardware version
+        return self.module.name + ' 1.0'
+
+    def handle_request(self, function_id, payload):
+        """
+        Returns the response payload, or None if there is no response.
+        """
+
+        if not function_id in self.module.functions:
+            return None
+
+        form, form_ret = self.module.functions[function_id]
+        self.values[function_id] = payload
+
+        if function_id in self.period_setters:
+            callback_id = self.period_setters[function_id]
+            period = struct.unpack('<' + form, payload[:get_size(form)])[0] / 1000.0
+            if period > 0:
+                self.periods[callback_id] = period
+                self.due[callback_id] = time.time() + period
+            elif callback_id in self.periods:
+                del self.periods[callback_id]
+                del self.due[callback_id]
+
+        size = get_size(form_ret)
+        if size == 0:
+            return None
+
+        setter = self.module.getters.get(function_id)
+        if setter in self.values and len(self.values[setter]) == size:
+            return self.values[setter]
+
+        return b'\0' * size
+
+    def get_due_callbacks(self, now):
+        packets = []
+        for callback_id in sorted(self.due.keys()):
+            if self.due[callback_id] > now:
+                continue
+
+            # Don't try to catch up, if the simulator fell behind
+            self.due[callback_id] = max(self.due[callback_id] + self.periods[callback_id], now)
+
+            form = self.module.callbacks[callback_id][0]
+            packets.append(struct.pack('<BBH', self.stack_id, callback_id, get_size(form) + 4) + \
+                           b'\0' * get_size(form))
+
+        return packets
+
+class Client:
+    """
+    Sends packets to a connected client, delayed by the latency.
+    """
+
+    def __init__(self, request, latency):
+        self.request = request
+        self.latency = latency
+        self.packets = deque() # (due, data)
+        self.condition = Condition()
+        self.write_lock = Lock()
+        self.closed = False
+
+        if latency > 0:
+            self.thread = Thread(target=self.send_loop)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def send(self, data):
+        if self.latency <= 0:
+            self.write(data)
+            return
+
+        self.condition.acquire()
+        try:
+            self.packets.append((time.time() + self.latency, data))
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+    def write(self, data):
+        self.write_lock.acquire()
+        try:
+            self.request.sendall(data)
+        except socket.error:
+            self.close()
+        finally:
+            self.write_lock.release()
+
+    def send_loop(self):
+        self.condition.acquire()
+        try:
+            while not self.closed:
+                if len(self.packets) == 0:
+                    self.condition.wait()
+                    continue
+
+                due, data = self.packets[0]
+                delay = due - time.time()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+
+                self.packets.popleft()
+                self.write(data)
+        finally:
+            self.condition.release()
+
+    def close(self):
+        self.condition.acquire()
+        try:
+            self.closed = True
+            self.condition.notify()
+        finally:
+            self.condition.release()
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        simulator = self.server.simulator
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = Client(self.request, simulator.latency)
+        simulator.add_client(client)
+
+        try:
+            pending = b''
+            while True:
+                try:
+                    data = self.request.recv(8192)
+                except socket.error:
+                    break
+
+                if len(data) == 0:
+                    break
+
+                pending += data
+                while len(pending) >= 4:
+                    length = struct.unpack('<H', pending[2:4])[0]
+                    if len(pending) < length or length < 4:
+                        break
+
+                    simulator.handle_packet(client, pending[:length])
+                    pending = pending[length:]
+        finally:
+            simulator.remove_client(client)
+            client.close()
+
+class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class Simulator:
+    def __init__(self, modules, latency=0):
+        """
+        Simulates a device per module in *modules*, in that order. *latency*
+        in seconds delays every packet sent to a client. At most MAX_DEVICES
+        devices can be simulated.
+        """
+
+        if len(modules) > MAX_DEVICES:
+            raise ValueError('Cannot simulate {0} devices, at most {1} stack IDs are available' \
+                             .format(len(modules), MAX_DEVICES))
+
+        self.latency = latency
+        self.devices = {} # stack ID -> device
+        self.uids = {} # UID -> device
+        self.clients = []
+        self.lock = Lock()
+        self.server = None
+        self.running = False
+
+        for i, module in enumerate(modules):
+            device = SimulatedDevice(module, UID_OFFSET + i + 1, i + 1)
+            self.devices[device.stack_id] = device
+            self.uids[device.uid] = device
+
+    def add_client(self, client):
+        self.lock.acquire()
+        try:
+            self.clients.append(client)
+        finally:
+            self.lock.release()
+
+    def remove_client(self, client):
+        self.lock.acquire()
+        try:
+            self.clients.remove(client)
+        finally:
+            self.lock.release()
+
+    def handle_packet(self, client, packet):
+        stack_id, function_id, length = struct.unpack('<BBH', packet[:4])
+
+        if function_id == FUNCTION_GET_STACK_ID:
+            uid = struct.unpack('<Q', packet[4:12])[0]
+            if uid in self.uids:
+                device = self.uids[uid]
+                client.send(struct.pack('<BBHQ3B40sB', BROADCAST_ADDRESS,
+                                        FUNCTION_GET_STACK_ID, 56, uid,
+                                        device.module.firmware_version[0],
+                                        device.module.firmware_version[1],
+                                        device.module.firmware_version[2],
+                                        device.get_name().encode('ascii'),
+                                        device.stack_id))
+            return
+
+        if function_id == FUNCTION_ENUMERATE:
+            for stack_id in sorted(self.devices.keys()):
+                device = self.devices[stack_id]
+                client.send(struct.pack('<BBHQ40sB?', BROADCAST_ADDRESS,
+                                        FUNCTION_ENUMERATE_CALLBACK, 54,
+                                        device.uid, device.get_name().encode('ascii'),
+                                        device.stack_id, True))
+            return
+
+        if not stack_id in self.devices:
+            return
+
+        self.lock.acquire()
+        try:
+            payload = self.devices[stack_id].handle_request(function_id, packet[4:])
+        finally:
+            self.lock.release()
+
+        if payload is not None:
+            client.send(struct.pack('<BBH', stack_id, function_id, len(payload) + 4) + payload)
+
+    def callback_loop(self):
+        while self.running:
+            now = time.time()
+            packets = []
+            due = now + 0.1
+
+            self.lock.acquire()
+            try:
+                for stack_id in sorted(self.devices.keys()):
+                    device = self.devices[stack_id]
+                    packets += device.get_due_callbacks(now)
+                    if len(device.due) > 0:
+                        due = min(due, min(device.due.values()))
+
+                clients = list(self.clients)
+            finally:
+                self.lock.release()
+
+            # brickd sends callbacks to all clients
+            if len(packets) > 0:
+                data = b''.join(packets)
+                for client in clients:
+                    client.send(data)
+
+            delay = due - time.time()
+            if delay > 0:
+                time.sleep(min(delay, 0.1))
+
+    def start(self, host='localhost', port=4223):
+        """
+        Starts serving in background threads, returns the port (useful for
+        port 0).
+        """
+
+        self.server = Server((host, port), RequestHandler)
+        self.server.simulator = self
+        self.running = True
+
+        for target in (self.server.serve_forever, self.callback_loop):
+            thread = Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+        return self.server.server_address[1]
+
+    def stop(self):
+        self.running = False
+        self.server.shutdown()
+        self.server.server_close()
+
+        # Disconnect the clients, like a stopped Brick Daemon
+        self.lock.acquire()
+        try:
+            clients = list(self.clients)
+        finally:
+            self.lock.release()
+
+        for client in clients:
+            client.close()
+            try:
+                client.request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+
+def load_modules(path, names):
+    """
+    Loads the simulator modules for names like 'brick_imu', a ':N' suffix
+    loads the module N times, e.g. 'bricklet_temperature:10'.
+    """
+
+    if not path in sys.path:
+        sys.path.insert(0, path)
+
+    modules = []
+    for name in names:
+        count = 1
+        if ':' in name:
+            name, count = name.split(':')
+
+        modules += [__import__(name)] * int(count)
+
+    return modules
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulates a Brick Daemon with Bricks and Bricklets')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=4223)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='delay of every packet in milliseconds')
+    parser.add_argument('--path', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulator'),
+                        help='directory of the generated simulator modules')
+    parser.add_argument('devices', nargs='+',
+                        help="device modules like 'brick_imu' or 'bricklet_temperature:10'")
+    args = parser.parse_args()
+
+    try:
+        simulator = Simulator(load_modules(args.path, args.devices), args.latency / 1000.0)
+    except ValueError as e:
+        parser.error(str(e))
+
+    for stack_id in sorted(simulator.devices.keys()):
+        device = simulator.devices[stack_id]
+        print(" * {0} ({1}), stack ID {2}".format(base58encode(device.uid), device.get_name(), stack_id))
+
+    simulator.start(args.host, args.port)
+    print("Listening on {0}:{1}".format(args.host, args.port))
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        simulator.stop()
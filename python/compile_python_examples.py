@@ -26,43 +26,42 @@ Boston, MA 02111-1307, USA.
 import sys
 import os
 import shutil
-import subprocess
-import py_compile
 
 sys.path.append(os.path.split(os.getcwd())[0])
 import common
 
-def walker(arg, dirname, names):
-    for name in names:
-        if not name.endswith('.py'):
-            continue
+def make_command(compiler_path, src):
+    args = [sys.executable,
+            '-m',
+            'py_compile',
+            src]
 
-        src = os.path.join(dirname, name)
+    return (os.path.relpath(src, compiler_path), args)
 
-        print 'compiling ' + src
-        py_compile.compile(src)
-
-def compile(path):
+def compile(path, jobs=None):
     version = common.get_changelog_version(path)
     zipname = 'tinkerforge_python_bindings_{0}_{1}_{2}.zip'.format(*version)
 
     # Make temporary examples directory
-    if os.path.exists('/tmp/compiler'):
-        shutil.rmtree('/tmp/compiler/')
-    os.makedirs('/tmp/compiler')
-    os.chdir('/tmp/compiler')
-
-    shutil.copy(os.path.join(path, zipname), '/tmp/compiler/')
-
-    # unzip
-    print 'unpacking ' + zipname
-    args = ['/usr/bin/unzip',
-            os.path.join('/tmp/compiler', zipname)]
-    subprocess.call(args)
-
-    # compile
-    os.path.walk('/tmp/compiler/examples', walker, None)
-    os.path.walk('/tmp/compiler/source', walker, None)
+    compiler_path = common.make_temp_dir('compiler')
+    try:
+        # unzip
+        print 'unpacking ' + zipname
+        common.extract_zip(os.path.join(path, zipname), compiler_path)
+
+        # compile
+        commands = []
+        for src in common.find_files(os.path.join(compiler_path, 'examples'), '.py'):
+            commands.append(make_command(compiler_path, src))
+        for src in common.find_files(os.path.join(compiler_path, 'source'), '.py'):
+            commands.append(make_command(compiler_path, src))
+
+        results = common.run_commands(commands, compiler_path, jobs)
+    finally:
+        # Remove temporary examples directory
+        shutil.rmtree(compiler_path)
+
+    return common.print_compile_summary('python', results)
 
 if __name__ == "__main__":
     compile(os.getcwd())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Python Benchmark Generator
+Copyright (C) 2012 Matthias Bolte <matthias@tinkerforge.com>
+
+generate_python_benchmark.py: Generator for binding benchmarks
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import datetime
+import sys
+import os
+
+sys.path.append(os.path.split(os.getcwd())[0])
+import common
+
+device = None
+
+def make_header():
+    header = """# -*- coding: utf-8 -*-
+{0}
+# Benchmark of the {1} {2} bindings, run by benchmark.py
+
+from tinkerforge.{3} import {4}
+
+name = '{1} {2}'
+device_class = {4}
+simulator = '{3}'
+"""
+    date = datetime.datetime.now().strftime("%Y-%m-%d")
+
+    return header.format(common.gen_text_hash.format(date),
+                         device.get_display_name(),
+                         device.get_category(),
+                         get_file_name(),
+                         device.get_camel_case_name())
+
+def get_file_name():
+    return '{0}_{1}'.format(device.get_category().lower(), device.get_underscore_name())
+
+def make_argument_from_element(element):
+    if element[1] == 'string':
+        return "'a'"
+
+    if element[1] == 'char':
+        value = "b'a'"
+    elif element[1] == 'bool':
+        value = 'False'
+    elif element[1] == 'float':
+        value = '0.0'
+    else:
+        value = '0'
+
+    if element[2] > 1:
+        return '({0},) * {1}'.format(value, element[2])
+
+    return value
+
+def make_argument_list(packet):
+    args = []
+    for element in packet.get_elements('in'):
+        args.append(make_argument_from_element(element))
+
+    if len(args) == 1:
+        return '({0},)'.format(args[0])
+
+    return '({0})'.format(', '.join(args))
+
+def make_functions():
+    functions = """
+# (method name, arguments, request format, response format)
+functions = [
+{0}]
+"""
+    function = "    ('{0}', {1}, {2}.FORMAT_REQUEST_{3}, {2}.FORMAT_RESPONSE_{3}),\n"
+    cls = device.get_camel_case_name()
+    lines = ''
+    for packet in device.get_packets('function'):
+        lines += function.format(packet.get_underscore_name(),
+                                 make_argument_list(packet),
+                                 cls,
+                                 packet.get_upper_case_name())
+
+    return functions.format(lines)
+
+def make_callbacks():
+    callbacks = """
+# (callback name, callback ID, format)
+callbacks = [
+{0}]
+"""
+    callback = "    ('{0}', {1}.CALLBACK_{2}, {1}.FORMAT_CALLBACK_{2}),\n"
+    cls = device.get_camel_case_name()
+    lines = ''
+    for packet in device.get_packets('callback'):
+        lines += callback.format(packet.get_underscore_name(),
+                                 cls,
+                                 packet.get_upper_case_name())
+
+    return callbacks.format(lines)
+
+def make_files(com_new, directory):
+    global device
+    device = common.Device(com_new)
+
+    directory += '/benchmark'
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # The prefix keeps the module names apart from the simulator modules
+    py = common.open_output('{0}/benchmark_{1}.py'.format(directory, get_file_name()), "w")
+    py.write(make_header())
+    py.write(make_functions())
+    py.write(make_callbacks())
+
+if __name__ == "__main__":
+    common.generate(os.getcwd(), make_files)
@@ -30,6 +30,7 @@ import os
 
 sys.path.append(os.path.split(os.getcwd())[0])
 import common
+import python_common
 
 device = None
 lang = 'en'
@@ -40,21 +41,16 @@ def fix_links(text):
 
     return text
 
-def make_import():
+def make_import(module='ip_connection'):
     include = """# -*- coding: utf-8 -*-
 {0}
-try:
-    from collections import namedtuple
-except ImportError:
-    from .ip_connection import namedtuple
-from .ip_connection import Device, IPConnection, Error
+from collections import namedtuple
+from .{1} import Device, IPConnection, Error, Format
 
 """
     date = datetime.datetime.now().strftime("%Y-%m-%d")
-    lower_type = device.get_category().lower()
 
-    return include.format(common.gen_text_hash.format(date),
-                          lower_type, device.get_underscore_name())
+    return include.format(common.gen_text_hash.format(date), module)
 
 def make_namedtuples():
     tup = """{0} = namedtuple('{1}', [{2}])
@@ -99,6 +95,42 @@ def make_function_id_definitions():
         function_ids += function_id.format(packet.get_upper_case_name(), packet.get_function_id())
     return function_ids
 
+def make_format_definitions():
+    formats = '\n'
+    form = "    FORMAT_{0}_{1} = Format('{2}'{3})\n"
+    for packet in device.get_packets('function'):
+        name = packet.get_upper_case_name()
+        result = make_format_names(packet, 'out')
+        if len(packet.get_elements('out')) > 1:
+            result = ', ' + packet.get_camel_case_name()
+
+        formats += form.format('REQUEST', name, python_common.make_format_list(packet, 'in'),
+                               make_format_names(packet, 'in'))
+        formats += form.format('RESPONSE', name, python_common.make_format_list(packet, 'out'), result)
+    for packet in device.get_packets('callback'):
+        formats += form.format('CALLBACK', packet.get_upper_case_name(),
+                               python_common.make_format_list(packet, 'out'), make_format_names(packet, 'out'))
+    return formats
+
+def make_format_names(packet, io):
+    names = ["'{0}'".format(element[0]) for element in packet.get_elements(io)]
+    if len(names) == 0:
+        return ''
+
+    return ', names=[{0}]'.format(', '.join(names))
+
+def make_dtype_definitions():
+    # Derived from the formats, so both always describe the same layout
+    dtypes = '\n'
+    dtype = "    DTYPE_{0}_{1} = FORMAT_{0}_{1}.get_dtype_description()\n"
+    for packet in device.get_packets('function'):
+        name = packet.get_upper_case_name()
+        dtypes += dtype.format('REQUEST', name)
+        dtypes += dtype.format('RESPONSE', name)
+    for packet in device.get_packets('callback'):
+        dtypes += dtype.format('CALLBACK', packet.get_upper_case_name())
+    return dtypes
+
 def make_init_method():
     dev_init = """
     def __init__(self, uid):
@@ -119,42 +151,34 @@ def make_init_method():
 
 def make_callback_formats():
     cbs = ''
-    cb = "        self.callback_formats[{0}.CALLBACK_{1}] = '{2}'\n"
+    cb = "        self.callback_formats[{0}.CALLBACK_{1}] = {0}.FORMAT_CALLBACK_{1}\n"
     for packet in device.get_packets('callback'):
-        form = make_format_list(packet, 'out')
-        cbs += cb.format(device.get_camel_case_name(), packet.get_upper_case_name(), form)
+        cbs += cb.format(device.get_camel_case_name(), packet.get_upper_case_name())
     return cbs
 
-def make_format_from_element(element):
-    forms = {
-        'int8' : 'b',
-        'uint8' : 'B',
-        'int16' : 'h',
-        'uint16' : 'H',
-        'int32' : 'i',
-        'uint32' : 'I',
-        'int64' : 'q',
-        'uint64' : 'Q',
-        'float' : 'f',
-        'bool' : '?',
-        'string' : 's',
-        'char' : 'c'
-    }
-
-    if element[1] in forms:
-        return forms[element[1]]
-
-    return ''
-
-def make_format_list(packet, io):
-    forms = []
-    for element in packet.get_elements(io):
-        num = ''
-        if element[2] > 1:
-            num = element[2]
-        form = make_format_from_element(element)
-        forms.append('{0}{1}'.format(num, form))
-    return " ".join(forms)
+def make_cached_getters():
+    getters = ''
+    getter = "        self.cached_getters[{0}.FUNCTION_{1}] = ({0}.FUNCTION_{2}, {0}.FORMAT_RESPONSE_{2})\n"
+    for setter, packet in device.get_cacheable_setter_getter_pairs():
+        getters += getter.format(device.get_camel_case_name(),
+                                 setter.get_upper_case_name(),
+                                 packet.get_upper_case_name())
+    return getters
+
+def make_callback_setters():
+    setters = ''
+    setter = "        self.callback_setters.add({0}.FUNCTION_{1})\n"
+    for packet in device.get_callback_setters():
+        setters += setter.format(device.get_camel_case_name(), packet.get_upper_case_name())
+    return setters
+
+def make_periodic_callbacks():
+    cbs = ''
+    cb = "        self.periodic_callbacks.add({0}.CALLBACK_{1})\n"
+    for packet in device.get_packets('callback'):
+        if device.get_period_setter(packet) is not None:
+            cbs += cb.format(device.get_camel_case_name(), packet.get_upper_case_name())
+    return cbs
 
 def make_parameter_list(packet):
     params = []
@@ -162,33 +186,31 @@ def make_parameter_list(packet):
         params.append(element[0])
     return ", ".join(params)
 
-def make_methods():
-    m_tup = """
-    def {0}(self{7}{4}):
-        \"\"\"
-        {9}
-        \"\"\"
-        return {1}(*self.ipcon.send_request(self, {2}.FUNCTION_{3}, ({4}{8}), '{5}', '{6}'))
-"""
+def make_methods(asynchronous=False):
     m_ret = """
-    def {0}(self{6}{3}):
+    {7}def {0}(self{4}{3}):
         \"\"\"
-        {8}
+        {6}
         \"\"\"
-        return self.ipcon.send_request(self, {1}.FUNCTION_{2}, ({3}{7}), '{4}', '{5}')
+        return {8}self.ipcon.send_request(self, {1}.FUNCTION_{2}, ({3}{5}), {1}.FORMAT_REQUEST_{2}, {1}.FORMAT_RESPONSE_{2})
 """
     m_nor = """
-    def {0}(self{6}{3}):
+    {7}def {0}(self{4}{3}):
         \"\"\"
-        {8}
+        {6}
         \"\"\"
-        self.ipcon.send_request(self, {1}.FUNCTION_{2}, ({3}{7}), '{4}', '{5}')
+        {8}self.ipcon.send_request(self, {1}.FUNCTION_{2}, ({3}{5}), {1}.FORMAT_REQUEST_{2}, {1}.FORMAT_RESPONSE_{2})
 """
     methods = ''
 
     cls = device.get_camel_case_name()
+    ad = ''
+    aw = ''
+    if asynchronous:
+        ad = 'async '
+        aw = 'await '
+
     for packet in device.get_packets('function'):
-        nb = packet.get_camel_case_name()
         ns = packet.get_underscore_name()
         nh = ns.upper()
         par = make_parameter_list(packet)
@@ -200,16 +222,12 @@ def make_methods():
             if not ',' in par:
                 ct = ','
 
-        in_f = make_format_list(packet, 'in')
-        out_f = make_format_list(packet, 'out')
-
-        elements = len(packet.get_elements('out'))
-        if elements > 1:
-            methods += m_tup.format(ns, nb, cls, nh, par, in_f, out_f, cp, ct, doc)
-        elif elements == 1:
-            methods += m_ret.format(ns, cls, nh, par, in_f, out_f, cp, ct, doc)
+        # Multiple return values are wrapped into the namedtuple by the
+        # response format
+        if len(packet.get_elements('out')) > 0:
+            methods += m_ret.format(ns, cls, nh, par, cp, ct, doc, ad, aw)
         else:
-            methods += m_nor.format(ns, cls, nh, par, in_f, out_f, cp, ct, doc)
+            methods += m_nor.format(ns, cls, nh, par, cp, ct, doc, ad, aw)
 
     return methods
 
@@ -235,16 +253,36 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    py = file('{0}/{1}.py'.format(directory, file_name), "w")
+    py = common.open_output('{0}/{1}.py'.format(directory, file_name), "w")
     py.write(make_import())
     py.write(make_namedtuples())
     py.write(make_class())
     py.write(make_callback_id_definitions())
     py.write(make_function_id_definitions())
+    py.write(make_format_definitions())
+    py.write(make_dtype_definitions())
     py.write(make_init_method())
     py.write(make_callback_formats())
+    py.write(make_cached_getters())
+    py.write(make_callback_setters())
+    py.write(make_periodic_callbacks())
     py.write(make_methods())
     py.write(make_register_callback_method())
 
+    # The asyncio variant only works with Python 3.7 or newer, it is not
+    # part of the egg. It is always written, so generate_all.py keeps it
+    # up to date like the other outputs of the unit
+    py = common.open_output('{0}/{1}_async.py'.format(directory, file_name), "w")
+    py.write(make_import('ip_connection_async'))
+    py.write(make_namedtuples())
+    py.write(make_class())
+    py.write(make_callback_id_definitions())
+    py.write(make_function_id_definitions())
+    py.write(make_format_definitions())
+    py.write(make_dtype_definitions())
+    py.write(make_init_method())
+    py.write(make_callback_formats())
+    py.write(make_methods(True))
+
 if __name__ == "__main__":
     common.generate(os.getcwd(), make_files)
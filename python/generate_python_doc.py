@@ -361,9 +361,9 @@ Alle folgend aufgelisteten Funktionen sind Thread-sicher.
 
     return api[lang].format(ref, api_desc, api_str)
        
-def copy_examples_for_zip():
+def copy_examples_for_zip(generator_path):
     examples = common.find_examples(device, file_path, 'python', 'example_', '.py')
-    dest = os.path.join('/tmp/generator/egg/examples/', 
+    dest = os.path.join(generator_path, 'egg/examples',
                         device.get_category().lower(),
                         device.get_underscore_name())
 
@@ -375,7 +375,9 @@ def copy_examples_for_zip():
   
 def make_files(com_new, directory):
     global device
+    global file_path
     device = common.Device(com_new)
+    file_path = directory
     file_name = '{0}_{1}_Python'.format(device.get_camel_case_name(), device.get_category())
     title = {
     'en': 'Python bindings',
@@ -386,47 +388,41 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    f = file('{0}/{1}.rst'.format(directory, file_name), "w")
+    f = common.open_output('{0}/{1}.rst'.format(directory, file_name), "w")
     f.write(common.make_rst_header(device, 'python', 'Python'))
     f.write(common.make_rst_summary(device, title[lang]))
     f.write(make_examples())
     f.write(make_api())
 
-    copy_examples_for_zip()
-
-def generate(path):
+def make_package(path):
+    global device
     global file_path
     file_path = path
-    path_list = path.split('/')
-    path_list[-1] = 'configs'
-    path_config = '/'.join(path_list)
-    sys.path.append(path_config)
-    configs = os.listdir(path_config)
 
     # Make temporary generator directory
-    if os.path.exists('/tmp/generator'):
-        shutil.rmtree('/tmp/generator/')
-    os.makedirs('/tmp/generator/egg/source/tinkerforge')
-    os.chdir('/tmp/generator')
-
-    # Make bindings
-    for config in configs:
-        if config.endswith('_config.py'):
-            module = __import__(config[:-3])
-            print(" * {0}".format(config[:-10]))            
-            make_files(module.com, path)
-
-    # Copy bindings and readme
-    for filename in glob.glob(path + '/bindings/*.py'):
-        shutil.copy(filename, '/tmp/generator/egg/source/tinkerforge')
-
-    shutil.copy(path + '/ip_connection.py', '/tmp/generator/egg/source/tinkerforge')
-    shutil.copy(path + '/changelog.txt', '/tmp/generator/egg')
-    shutil.copy(path + '/readme.txt', '/tmp/generator/egg')
-
-    # Write setup.py
-    version = common.get_changelog_version(path)
-    file('/tmp/generator/egg/source/setup.py', 'wb').write("""
+    generator_path = common.make_temp_dir('generator')
+    try:
+        os.makedirs(generator_path + '/egg/source/tinkerforge')
+
+        # Copy examples
+        for config in common.get_configs(path):
+            device = common.Device(common.load_config(path, config))
+            copy_examples_for_zip(generator_path)
+
+        # Copy bindings and readme, the asyncio variants need Python 3.7
+        for filename in glob.glob(path + '/bindings/*.py'):
+            if filename.endswith('_async.py'):
+                continue
+
+            shutil.copy(filename, generator_path + '/egg/source/tinkerforge')
+
+        shutil.copy(path + '/ip_connection.py', generator_path + '/egg/source/tinkerforge')
+        shutil.copy(path + '/changelog.txt', generator_path + '/egg')
+        shutil.copy(path + '/readme.txt', generator_path + '/egg')
+
+        # Write setup.py
+        version = common.get_changelog_version(path)
+        file(generator_path + '/egg/source/setup.py', 'wb').write("""
 #!/usr/bin/env python
 
 from setuptools import setup
@@ -440,28 +436,34 @@ setup(name='tinkerforge',
       packages=['tinkerforge'])
 """.format(*version))
 
-    # Make egg
-    os.chdir('/tmp/generator/egg/source')
-    args = ['/usr/bin/python',
-            'setup.py',
-            'bdist_egg']
-    subprocess.call(args)
-
-    # Remove build stuff
-    shutil.rmtree('/tmp/generator/egg/source/build')
-    shutil.rmtree('/tmp/generator/egg/source/tinkerforge.egg-info')
-    shutil.copy('/tmp/generator/egg/source/dist/' + 
-                os.listdir('/tmp/generator/egg/source/dist')[0], 
-                '/tmp/generator/egg/tinkerforge.egg')
-    shutil.rmtree('/tmp/generator/egg/source/dist')
-
-    # Make __init__.py
-    f = open('/tmp/generator/egg/source/tinkerforge/__init__.py', 'w')
-    f.write(' ')
-    f.close()
-
-    # Make zip
-    common.make_zip('python', '/tmp/generator/egg', path, version)
+        # Make egg
+        args = ['/usr/bin/python',
+                'setup.py',
+                'bdist_egg']
+        subprocess.call(args, cwd=generator_path + '/egg/source')
+
+        # Remove build stuff
+        shutil.rmtree(generator_path + '/egg/source/build')
+        shutil.rmtree(generator_path + '/egg/source/tinkerforge.egg-info')
+        shutil.copy(generator_path + '/egg/source/dist/' + 
+                    os.listdir(generator_path + '/egg/source/dist')[0], 
+                    generator_path + '/egg/tinkerforge.egg')
+        shutil.rmtree(generator_path + '/egg/source/dist')
+
+        # Make __init__.py
+        f = open(generator_path + '/egg/source/tinkerforge/__init__.py', 'w')
+        f.write(' ')
+        f.close()
+
+        # Make zip
+        common.make_zip('python', generator_path + '/egg', path, version)
+    finally:
+        # Remove temporary generator directory
+        shutil.rmtree(generator_path)
+
+def generate(path):
+    common.generate(path, make_files)
+    make_package(path)
 
 if __name__ == "__main__":
     generate(os.getcwd())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Python Simulator Generator
+Copyright (C) 2012 Matthias Bolte <matthias@tinkerforge.com>
+
+generate_python_simulator.py: Generator for simulated devices
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+import datetime
+import sys
+import os
+
+sys.path.append(os.path.split(os.getcwd())[0])
+import common
+import python_common
+
+device = None
+
+def make_header():
+    header = """# -*- coding: utf-8 -*-
+{0}
+# Simulated {1} {2}, loaded by brickd_simulator.py
+
+name = '{1} {2}'
+firmware_version = {3}
+"""
+    date = datetime.datetime.now().strftime("%Y-%m-%d")
+
+    return header.format(common.gen_text_hash.format(date),
+                         device.get_display_name(),
+                         device.get_category(),
+                         str(device.get_version()))
+
+def make_functions():
+    functions = """
+# function ID -> (request format, response format)
+functions = {{
+{0}}}
+"""
+    function = "    {0}: ('{1}', '{2}'), # {3}\n"
+    lines = ''
+    for packet in device.get_packets('function'):
+        lines += function.format(packet.get_function_id(),
+                                 python_common.make_format_list(packet, 'in'),
+                                 python_common.make_format_list(packet, 'out'),
+                                 packet.get_underscore_name())
+
+    return functions.format(lines)
+
+def make_getters():
+    getters = """
+# getter function ID -> setter function ID, a getter returns the last
+# value given to its setter
+getters = {{
+{0}}}
+"""
+    getter = "    {0}: {1}, # {2}\n"
+    lines = ''
+    for setter, packet in device.get_setter_getter_pairs():
+        lines += getter.format(packet.get_function_id(),
+                               setter.get_function_id(),
+                               packet.get_underscore_name())
+
+    return getters.format(lines)
+
+def make_callbacks():
+    callbacks = """
+# callback ID -> (format, function ID of the period setter), callbacks
+# without period setter are never sent
+callbacks = {{
+{0}}}
+"""
+    callback = "    {0}: ('{1}', {2}), # {3}\n"
+    lines = ''
+    for packet in device.get_packets('callback'):
+        setter = device.get_period_setter(packet)
+        if setter is not None:
+            setter = setter.get_function_id()
+
+        lines += callback.format(packet.get_function_id(),
+                                 python_common.make_format_list(packet, 'out'),
+                                 setter,
+                                 packet.get_underscore_name())
+
+    return callbacks.format(lines)
+
+def make_files(com_new, directory):
+    global device
+    device = common.Device(com_new)
+
+    file_name = '{0}_{1}'.format(device.get_category().lower(), device.get_underscore_name())
+
+    directory += '/simulator'
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    py = common.open_output('{0}/{1}.py'.format(directory, file_name), "w")
+    py.write(make_header())
+    py.write(make_functions())
+    py.write(make_getters())
+    py.write(make_callbacks())
+
+if __name__ == "__main__":
+    common.generate(os.getcwd(), make_files)
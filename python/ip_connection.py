@@ -5,7 +5,7 @@
 # Redistribution and use in source and binary forms of this file, 
 # with or without modification, are permitted. 
 
-from threading import Thread, Lock, current_thread
+from threading import Thread, Lock, Condition, current_thread, local
 # Queue for python 2, queue for python 3
 try:
     from Queue import Queue
@@ -13,20 +13,18 @@ try:
 except ImportError:
     from queue import Queue
     from queue import Empty
+from collections import deque
+import mmap
+import math
 import struct
 import socket
 import types
+import time
 import sys
 
-# use normal tuples instead of namedtuples in python version below 2.6
-if sys.hexversion < 0x02060000:
-    def namedtuple(typename, field_names, verbose=False, rename=False):
-        def ntuple(*args):
-            return args
-
-        return ntuple
-else:
-    from collections import namedtuple
+# Requires Python 2.7 or newer, the receive path uses bytearray, memoryview
+# and recv_into
+from collections import namedtuple
 
 def get_stack_id_from_data(data):
     return ord(data[0:0 + 1])
@@ -37,6 +35,144 @@ def get_function_id_from_data(data):
 def get_length_from_data(data):
     return struct.unpack('<H', data[2:4])[0]
 
+if hasattr(time, 'monotonic'):
+    get_timestamp = time.monotonic
+else:
+    get_timestamp = time.time
+
+# NumPy structured dtype description of the packet header, the generated
+# DTYPE_* descriptions of a device cover the payloads
+DTYPE_HEADER = [('stack_id', '<u1'), ('function_id', '<u1'), ('length', '<u2')]
+
+def encode_string(value):
+    if sys.hexversion < 0x03000000:
+        if type(value) == types.UnicodeType:
+            return value.encode('ascii')
+    elif isinstance(value, str):
+        return bytes(value, 'ascii')
+
+    return value
+
+class Format:
+    """
+    Precompiled little endian layout of the payload of a request, response
+    or callback, e.g. 'c B 32s'. A whole request is packed and a whole
+    payload is unpacked with a single struct call. If *result* is given,
+    unpacked values are returned as *result(\*values)*. *names* are the
+    field names of :py:func:`get_dtype <Format.get_dtype>`.
+    """
+
+    DTYPE_CODES = {'b': 'i1', 'B': 'u1', 'h': 'i2', 'H': 'u2', 'i': 'i4', 'I': 'u4',
+                   'q': 'i8', 'Q': 'u8', 'f': 'f4', '?': 'b1', 'c': 'S1'}
+
+    def __init__(self, form, result=None, names=None):
+        self.form = form
+        self.result = result
+        self.names = names
+        if names is None and result is not None:
+            self.names = list(result._fields)
+        self.kinds = [] # 1 for single values, 's' for strings, n for arrays
+        layout = ''
+
+        for f in form.split(' '):
+            if len(f) == 0:
+                continue
+
+            layout += f
+            if 's' in f:
+                self.kinds.append('s')
+            elif len(f) > 1:
+                self.kinds.append(int(f[:-1]))
+            else:
+                self.kinds.append(1)
+
+        self.struct = struct.Struct('<' + layout)
+        self.request = struct.Struct('<BBH' + layout)
+        self.size = self.struct.size
+
+        # Without strings and arrays values and elements map one to one
+        self.flat = len([k for k in self.kinds if k != 1]) == 0
+
+    def pack(self, stack_id, function_id, data):
+        if self.flat:
+            return self.request.pack(stack_id, function_id, self.request.size, *data)
+
+        values = []
+        for kind, d in zip(self.kinds, data):
+            if kind == 1:
+                values.append(d)
+            elif kind == 's':
+                values.append(encode_string(d))
+            else:
+                values.extend(d)
+
+        return self.request.pack(stack_id, function_id, self.request.size, *values)
+
+    def unpack(self, data):
+        values = self.struct.unpack_from(data)
+
+        if not self.flat:
+            grouped = []
+            i = 0
+            for kind in self.kinds:
+                if kind == 1 or kind == 's':
+                    grouped.append(values[i])
+                    i += 1
+                else:
+                    grouped.append(values[i:i + kind])
+                    i += kind
+            values = grouped
+
+        if self.result is not None:
+            return self.result(*values)
+
+        if len(values) == 1:
+            return values[0]
+
+        return list(values)
+
+    def get_dtype(self):
+        """
+        Returns a little endian NumPy structured dtype of the payload.
+        Requires NumPy, which is only imported here.
+        """
+
+        import numpy
+
+        return numpy.dtype(self.get_dtype_description())
+
+    def get_dtype_description(self):
+        """
+        Returns the list of (name, type[, shape]) tuples of
+        :py:func:`get_dtype <Format.get_dtype>`, without importing NumPy.
+        """
+
+        fields = []
+        for i, f in enumerate([f for f in self.form.split(' ') if len(f) > 0]):
+            if self.names is not None:
+                name = self.names[i]
+            else:
+                name = 'f{0}'.format(i)
+
+            if self.kinds[i] == 's':
+                fields.append((name, 'S' + f[:-1]))
+            elif self.kinds[i] == 1:
+                fields.append((name, '<' + Format.DTYPE_CODES[f]))
+            else:
+                fields.append((name, '<' + Format.DTYPE_CODES[f[-1]], (self.kinds[i],)))
+
+        return fields
+
+formats = {}
+def get_format(form):
+    if isinstance(form, Format):
+        return form
+
+    if not form in formats:
+        formats[form] = Format(form)
+
+    return formats[form]
+
 BASE58 = '123456789abcdefghijkmnopqrstuvwxyzABCDEFGHJKLMNPQRSTUVWXYZ'
 def base58encode(value):
     encoded = ''
@@ -93,6 +229,92 @@ class DeviceConChecker(type):
 
 DeviceConCheckerMeta = DeviceConChecker('DeviceConCheckerMeta', (object, ), {})
 
+class BlockBuffer:
+    """
+    Collects the raw payloads of a callback in a preallocated buffer, see
+    :py:func:`Device.register_block_callback`.
+    """
+
+    def __init__(self, form, callback, block_size):
+        self.dtype = form.get_dtype()
+        self.callback = callback
+        self.block_size = block_size
+        self.size = form.size
+        self.data = bytearray(block_size * self.size)
+        self.count = 0
+        self.lock = Lock()
+        self.closed = False
+
+    def append(self, payload):
+        """
+        Copies the payload into the buffer. Returns the buffer if it is
+        full, a new one is used for the following payloads.
+        """
+
+        if len(payload) < self.size:
+            # Malformed, would shift all following values of the block
+            return None
+
+        self.lock.acquire()
+        try:
+            if self.closed:
+                return None
+
+            offset = self.count * self.size
+            self.data[offset:offset + self.size] = payload[:self.size]
+            self.count += 1
+
+            if self.count < self.block_size:
+                return None
+
+            block = self.data
+            self.data = bytearray(len(block))
+            self.count = 0
+
+            return block
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        """
+        Returns the values collected since the last full block, or None if
+        there are none. The buffer doesn't take payloads anymore.
+        """
+
+        self.lock.acquire()
+        try:
+            self.closed = True
+
+            if self.count == 0:
+                return None
+
+            block = self.data[:self.count * self.size]
+            self.count = 0
+
+            return block
+        finally:
+            self.lock.release()
+
+    def dispatch(self, block):
+        import numpy
+
+        self.callback(numpy.frombuffer(block, self.dtype))
+
+class StaleResponse:
+    """
+    Takes the place of a waiter whose request timed out, so its late
+    response is dropped instead of being handed to the next request for the
+    same function. Expires after another timeout, if no response comes.
+    If it dropped the response of a later request instead, that request
+    times out as well, but doesn't become a StaleResponse itself.
+    """
+
+    def __init__(self, timeout):
+        self.expires = time.time() + timeout
+
+    def put(self, response):
+        pass
+
 GetVersion = namedtuple('Version', ['name', 'firmware_version', 'binding_version'])
 
 class Device(DeviceConCheckerMeta):
@@ -105,10 +327,21 @@ class Device(DeviceConCheckerMeta):
         self.firmware_version = [0, 0, 0]
         self.binding_version = [0, 0, 0]
         self.registered_callbacks = {}
+        self.registered_block_callbacks = {}
         self.callback_formats = {}
-        self.expected_response_function_id = -1
-        self.response_queue = Queue()
+        self.pending_responses = {} # function ID -> FIFO of waiting queues
+        self.stale_drops = {} # function ID -> number of responses dropped by a StaleResponse
+        self.response_lock = Lock()
         self.write_lock = Lock()
+        self.cached_getters = {} # setter function ID -> (getter function ID, getter format)
+        self.cache = None # getter function ID -> (timestamp, value), if enabled
+        self.cache_getter_ids = set()
+        self.cache_ttl = None
+        self.cache_version = 0 # incremented by every setter and invalidation
+        self.cache_lock = Lock()
+        self.callback_setters = set() # function IDs of the callback configuration
+        self.callback_configuration = {} # function ID -> last request of a callback setter
+        self.periodic_callbacks = set() # callback IDs of values sent in a period
 
     def get_version(self):
         """
@@ -118,6 +351,584 @@ class Device(DeviceConCheckerMeta):
         """
         return GetVersion(self.name, self.firmware_version, self.binding_version)
 
+    def register_block_callback(self, id, callback, block_size):
+        """
+        Registers the function *callback* for blocks of the callback with
+        ID *id*, instead of calling a function per value. Values are copied
+        into a preallocated buffer as they arrive. Every *block_size* values
+        *callback* is called with a NumPy structured array of them, its
+        fields are named like the callback parameters. Requires NumPy.
+        """
+        form = get_format(self.callback_formats[id])
+        block_buffer = BlockBuffer(form, callback, block_size)
+
+        self.flush_block_callback(id, self.registered_block_callbacks.get(id))
+        self.registered_block_callbacks[id] = block_buffer
+
+    def unregister_block_callback(self, id):
+        """
+        Unregisters the block callback with ID *id*. Values that don't fill
+        a block yet are passed to its function as a shorter block.
+        """
+        self.flush_block_callback(id, self.registered_block_callbacks.pop(id, None))
+
+    def flush_block_callback(self, id, block_buffer):
+        if block_buffer is None:
+            return
+
+        block = block_buffer.flush()
+        if block is None:
+            return
+
+        if self.ipcon is not None:
+            # Behind the blocks that are queued already
+            self.ipcon.queue_callback(self.stack_id, (self.stack_id, id, block_buffer, block), None)
+        else:
+            block_buffer.dispatch(block)
+
+    def enable_cache(self, ttl=None):
+        """
+        Answers the getters of configuration values, like the callback
+        periods and thresholds, without asking the device. A setter stores
+        its value for the matching getter, the first call of a getter asks
+        the device. If *ttl* is given, cached values expire after *ttl*
+        seconds. The cache is cleared if the device is added again, reported
+        as new by an enumeration or if a Brick is reset.
+        """
+        self.cache_lock.acquire()
+        try:
+            self.cache = {}
+            self.cache_ttl = ttl
+            self.cache_getter_ids = set([getter[0] for getter in self.cached_getters.values()])
+            self.cache_version += 1
+        finally:
+            self.cache_lock.release()
+
+    def disable_cache(self):
+        """
+        Disables the cache enabled by :py:func:`enable_cache <Device.enable_cache>`.
+        """
+        self.cache_lock.acquire()
+        try:
+            self.cache = None
+            self.cache_version += 1
+        finally:
+            self.cache_lock.release()
+
+    def invalidate_cache(self):
+        """
+        Clears the cache, the next call of every getter asks the device.
+        """
+        self.cache_lock.acquire()
+        try:
+            if self.cache is not None:
+                self.cache = {}
+            self.cache_version += 1
+        finally:
+            self.cache_lock.release()
+
+    def get_cached_value(self, function_id):
+        # Returns the cached response of a getter, or None
+        cache = self.cache
+        if cache is None or not function_id in cache:
+            return None
+
+        timestamp, value = cache[function_id]
+        if self.cache_ttl is not None and get_timestamp() - timestamp > self.cache_ttl:
+            return None
+
+        return value
+
+    def set_cached_value(self, function_id, value, version=None):
+        # A getter response is only stored if no setter or invalidation
+        # happened since its request was sent
+        self.cache_lock.acquire()
+        try:
+            if self.cache is None or (version is not None and version != self.cache_version):
+                return
+
+            self.cache[function_id] = (get_timestamp(), value)
+            if version is None:
+                self.cache_version += 1
+        finally:
+            self.cache_lock.release()
+
+class Batch:
+    """
+    Requests of the current thread are collected instead of sent while the
+    batch is active (see :py:func:`IPConnection.batch`). They return None,
+    the results are stored in *results* when the batch ends.
+    """
+
+    def __init__(self, ipcon):
+        self.ipcon = ipcon
+        self.requests = []
+        self.results = None
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = getattr(self.ipcon.batch_local, 'batch', None)
+        self.ipcon.batch_local.batch = self
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.ipcon.batch_local.batch = self.previous
+
+        if type is None:
+            self.results = self.ipcon.send_batch(self.requests)
+
+        return False
+
+class CallbackQueue:
+    """
+    Callback packets and blocks of all devices, shared by the callback
+    threads. Items are grouped by device (stack ID): a thread takes the next
+    item of a device only after the previous one was
+    :py:func:`done <CallbackQueue.done>`, so the callbacks of a device keep
+    their order, while the other threads serve the other devices. If
+    *maxsize* is not 0 the *policy* decides what happens if the queue is full:
+
+    * QUEUE_BLOCK - put waits until an item was taken.
+    * QUEUE_DROP_OLDEST - the oldest item is dropped.
+    * QUEUE_COALESCE_LATEST - an item replaces the queued item with the
+      same key (stack ID and function ID), so only the latest value is
+      delivered. This happens even if the queue isn't full. If there is
+      none, put waits. Items without key are never coalesced, only
+      periodic callbacks get one.
+
+    put is called from the receive thread, which also delivers the responses
+    to getters called from callbacks. So put waits at most BLOCK_TIMEOUT
+    seconds, then the oldest item is dropped anyway.
+
+    put returns the number of items that were dropped or replaced.
+    """
+
+    QUEUE_BLOCK = 0
+    QUEUE_DROP_OLDEST = 1
+    QUEUE_COALESCE_LATEST = 2
+
+    BLOCK_TIMEOUT = 0.5
+
+    def __init__(self, maxsize=0, policy=QUEUE_BLOCK):
+        self.maxsize = maxsize
+        self.policy = policy
+        self.groups = {} # stack ID -> FIFO of [key, item, sequence number]
+        self.ready = set() # stack IDs with items that no thread works on
+        self.busy = set() # stack IDs a thread works on
+        self.size = 0
+        self.sequence = 0
+        self.latest = {} # key -> queued entry, for coalescing
+        self.condition = Condition()
+        self.closed = False
+
+    def put(self, item, key=None, group=0):
+        self.condition.acquire()
+        try:
+            if self.policy == CallbackQueue.QUEUE_COALESCE_LATEST and key in self.latest:
+                self.latest[key][1] = item
+                return 1
+
+            dropped = 0
+            deadline = get_timestamp() + CallbackQueue.BLOCK_TIMEOUT
+            while not self.closed and self.maxsize > 0 and self.size >= self.maxsize:
+                remaining = deadline - get_timestamp()
+
+                if self.policy == CallbackQueue.QUEUE_DROP_OLDEST or remaining <= 0:
+                    self.drop_oldest()
+                    dropped += 1
+                else:
+                    self.condition.wait(remaining)
+
+            if self.closed:
+                return dropped
+
+            entry = [key, item, self.sequence]
+            self.sequence += 1
+
+            if not group in self.groups:
+                self.groups[group] = deque()
+                if not group in self.busy:
+                    self.ready.add(group)
+
+            self.groups[group].append(entry)
+            self.size += 1
+
+            if self.policy == CallbackQueue.QUEUE_COALESCE_LATEST and key is not None:
+                self.latest[key] = entry
+
+            self.condition.notify_all()
+
+            return dropped
+        finally:
+            self.condition.release()
+
+    def get(self):
+        """
+        Returns the group and the next item of a group no other thread works
+        on, or None after the queue was closed. The group is blocked until
+        :py:func:`done <CallbackQueue.done>` is called for it.
+        """
+
+        self.condition.acquire()
+        try:
+            while not self.closed and len(self.ready) == 0:
+                self.condition.wait()
+
+            if self.closed:
+                return None
+
+            # Oldest item first, as long as its device isn't busy
+            group = self.oldest(self.ready)
+            self.ready.remove(group)
+            entry = self.remove(group)
+            self.busy.add(group)
+            self.condition.notify_all()
+
+            return group, entry[1]
+        finally:
+            self.condition.release()
+
+    def done(self, group):
+        self.condition.acquire()
+        try:
+            self.busy.discard(group)
+            if group in self.groups:
+                self.ready.add(group)
+
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    def qsize(self):
+        return self.size
+
+    def empty(self):
+        return self.size == 0
+
+    def wait_empty(self):
+        # Until all items were taken and their callbacks returned
+        self.condition.acquire()
+        try:
+            while not self.closed and (self.size > 0 or len(self.busy) > 0):
+                self.condition.wait()
+        finally:
+            self.condition.release()
+
+    def oldest(self, groups):
+        # The oldest item of a group is at its front
+        return min(groups, key=lambda group: self.groups[group][0][2])
+
+    def drop_oldest(self):
+        group = self.oldest(self.groups.keys())
+        self.remove(group)
+
+        if not group in self.groups:
+            self.ready.discard(group)
+
+    def remove(self, group):
+        entries = self.groups[group]
+        entry = entries.popleft()
+        self.size -= 1
+
+        if len(entries) == 0:
+            del self.groups[group]
+
+        if entry[0] is not None and self.latest.get(entry[0]) is entry:
+            del self.latest[entry[0]]
+
+        return entry
+
+    def close(self):
+        self.condition.acquire()
+        try:
+            self.closed = True
+            self.groups.clear()
+            self.ready.clear()
+            self.latest.clear()
+            self.size = 0
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+CAPTURE_MAGIC = b'TFCAP001'
+
+class PacketRecorder:
+    """
+    Appends packets to a binary capture log. The log starts with
+    CAPTURE_MAGIC, followed by one record per packet: a little endian double
+    monotonic timestamp in seconds, a direction byte (RECEIVED or SENT) and
+    the packet itself, which contains its own length. The log is only ever
+    appended to and can be read with a memory map, see
+    :py:func:`read_capture`.
+    """
+
+    RECEIVED = 0
+    SENT = 1
+
+    RECORD = struct.Struct('<dB')
+
+    def __init__(self, filename):
+        self.file = open(filename, 'ab')
+        self.lock = Lock()
+
+        if self.file.tell() == 0:
+            self.file.write(CAPTURE_MAGIC)
+
+    def record(self, direction, data):
+        timestamp = get_timestamp()
+
+        self.lock.acquire()
+        try:
+            if self.file.closed:
+                return
+
+            # data can hold several packets, e.g. of a batch
+            while len(data) >= 4:
+                length = get_length_from_data(data)
+                self.file.write(PacketRecorder.RECORD.pack(timestamp, direction))
+                self.file.write(data[:length])
+                data = data[length:]
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.file.close()
+        finally:
+            self.lock.release()
+
+def get_capture_index(data):
+    """
+    Returns a list of (timestamp, direction, offset, length) for the
+    packets in the capture log *data* (e.g. a memory map of the file).
+    """
+
+    if data[0:len(CAPTURE_MAGIC)] != CAPTURE_MAGIC:
+        raise ValueError('Not a capture log')
+
+    index = []
+    offset = len(CAPTURE_MAGIC)
+    size = PacketRecorder.RECORD.size
+
+    while offset + size + 4 <= len(data):
+        timestamp, direction = PacketRecorder.RECORD.unpack_from(data, offset)
+        length = struct.unpack_from('<H', data, offset + size + 2)[0]
+
+        if offset + size + length > len(data) or length < 4:
+            break # incomplete last record
+
+        index.append((timestamp, direction, offset + size, length))
+        offset += size + length
+
+    return index
+
+def read_capture(filename):
+    """
+    Yields (timestamp, direction, packet) for every packet of the capture
+    log *filename*.
+    """
+
+    f = open(filename, 'rb')
+    try:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            for timestamp, direction, offset, length in get_capture_index(data):
+                yield timestamp, direction, data[offset:offset + length]
+        finally:
+            data.close()
+    finally:
+        f.close()
+
+class Histogram:
+    """
+    Histogram of durations in seconds. Bucket *i* counts the durations from
+    2^(i-1) up to 2^i microseconds, so adding a duration is cheap and the
+    percentiles are exact up to a factor of two.
+    """
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.buckets = [0] * Histogram.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, duration):
+        bucket = math.frexp(int(duration * 1000000))[1]
+        self.buckets[min(bucket, Histogram.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += duration
+        self.maximum = max(self.maximum, duration)
+
+    def get_mean(self):
+        if self.count == 0:
+            return 0.0
+
+        return self.total / self.count
+
+    def get_percentile(self, percentile):
+        """
+        Returns the upper bound of the bucket that contains the given
+        *percentile* (0 to 100) of the durations, in seconds.
+        """
+
+        rank = self.count * percentile / 100.0
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if count > 0 and seen >= rank:
+                return min((1 << i) / 1000000.0, self.maximum)
+
+        return self.maximum
+
+class Statistics:
+    """
+    Counters of an IP connection, see :py:func:`IPConnection.start_statistics`.
+    Latencies and callback durations are kept per device and function ID in
+    *requests* and *callbacks*, keyed by (UID, function ID) with the UID as
+    integer. All updates take a single lock, so the statistics can stay
+    enabled during normal operation.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.lock.acquire()
+        try:
+            self.requests = {} # (UID, function ID) -> Histogram of round-trips
+            self.timeouts = {} # (UID, function ID) -> number of timeouts
+            self.callbacks = {} # (UID, function ID) -> Histogram of handler durations
+            self.names = {} # UID -> device name
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.packets_sent = 0
+            self.packets_received = 0
+            self.unknown_device_packets = 0 # responses from devices that weren't added
+            self.callbacks_dropped = 0 # dropped or replaced by the queue policy
+            self.queue_depth = 0 # maximum number of queued callbacks
+        finally:
+            self.lock.release()
+
+    def get_histogram(self, histograms, device, function_id):
+        key = (device.uid, function_id)
+        if not key in histograms:
+            histograms[key] = Histogram()
+            self.names[device.uid] = device.name
+
+        return histograms[key]
+
+    def add_request(self, device, function_id, duration):
+        self.lock.acquire()
+        try:
+            self.get_histogram(self.requests, device, function_id).add(duration)
+        finally:
+            self.lock.release()
+
+    def add_timeout(self, device, function_id):
+        self.lock.acquire()
+        try:
+            key = (device.uid, function_id)
+            self.timeouts[key] = self.timeouts.get(key, 0) + 1
+            self.names[device.uid] = device.name
+        finally:
+            self.lock.release()
+
+    def add_callback(self, device, function_id, duration):
+        self.lock.acquire()
+        try:
+            self.get_histogram(self.callbacks, device, function_id).add(duration)
+        finally:
+            self.lock.release()
+
+    def add_sent(self, data):
+        packets = 0
+        offset = 0
+        while offset + 4 <= len(data):
+            offset += get_length_from_data(data[offset:offset + 4])
+            packets += 1
+
+        self.lock.acquire()
+        try:
+            self.bytes_sent += len(data)
+            self.packets_sent += packets
+        finally:
+            self.lock.release()
+
+    def add_received(self, length, packets):
+        self.lock.acquire()
+        try:
+            self.bytes_received += length
+            self.packets_received += packets
+        finally:
+            self.lock.release()
+
+    def add_unknown_device_packet(self):
+        self.lock.acquire()
+        try:
+            self.unknown_device_packets += 1
+        finally:
+            self.lock.release()
+
+    def add_queued(self, depth, dropped):
+        self.lock.acquire()
+        try:
+            self.queue_depth = max(self.queue_depth, depth)
+            self.callbacks_dropped += dropped
+        finally:
+            self.lock.release()
+
+    def get_report(self):
+        """
+        Returns the statistics as human readable table, requests are sorted
+        by their total time, so the devices that slow down a program the
+        most come first.
+        """
+
+        self.lock.acquire()
+        try:
+            lines = ['Sent: {0} packets, {1} bytes'.format(self.packets_sent, self.bytes_sent),
+                     'Received: {0} packets, {1} bytes'.format(self.packets_received, self.bytes_received),
+                     'Responses from unknown devices: {0}'.format(self.unknown_device_packets),
+                     'Callbacks dropped by the queue: {0}'.format(self.callbacks_dropped),
+                     'Maximum callback queue depth: {0}'.format(self.queue_depth)]
+
+            for title, histograms in (('Requests', self.requests), ('Callbacks', self.callbacks)):
+                lines.append('')
+                lines.append('{0:<8} {1:<30} {2:>8} {3:>8} {4:>8} {5:>10} {6:>10} {7:>10} {8:>10}' \
+                             .format('UID', title, 'Function', 'Count', 'Timeouts',
+                                     'Mean ms', 'P50 ms', 'P99 ms', 'Max ms'))
+
+                keys = set(histograms.keys())
+                if histograms is self.requests:
+                    keys.update(self.timeouts.keys())
+
+                def total(key):
+                    if key in histograms:
+                        return histograms[key].total
+                    return 0.0
+
+                for key in sorted(keys, key=total, reverse=True):
+                    histogram = histograms.get(key, Histogram())
+                    timeouts = ''
+                    if histograms is self.requests:
+                        timeouts = self.timeouts.get(key, 0)
+
+                    lines.append('{0:<8} {1:<30} {2:>8} {3:>8} {4:>8} {5:>10.3f} {6:>10.3f} {7:>10.3f} {8:>10.3f}' \
+                                 .format(base58encode(key[0]), self.names.get(key[0], ''), key[1],
+                                         histogram.count, timeouts,
+                                         histogram.get_mean() * 1000,
+                                         histogram.get_percentile(50) * 1000,
+                                         histogram.get_percentile(99) * 1000,
+                                         histogram.maximum * 1000))
+
+            return '\n'.join(lines)
+        finally:
+            self.lock.release()
+
 class IPConnection:
     FUNCTION_GET_STACK_ID = 255
     FUNCTION_ENUMERATE = 254
@@ -132,6 +943,7 @@ class IPConnection:
     FUNCTION_WRITE_BRICKLET_PLUGIN = 246
     FUNCTION_READ_BRICKLET_NAME = 245
     FUNCTION_WRITE_BRICKLET_NAME = 244
+    FUNCTION_RESET = 243
 
     BROADCAST_ADDRESS = 0
     ENUMERATE_LENGTH = 4
@@ -141,23 +953,54 @@ class IPConnection:
 
     PLUGIN_CHUNK_SIZE = 32
 
-    callback_queue = Queue()
+    CONNECTION_DISCONNECTED = 0
+    CONNECTION_CONNECTED = 1
+
+    RECONNECT_DELAY_MIN = 0.1
+    RECONNECT_DELAY_MAX = 10.0
 
-    def __init__(self, host, port):
+    def __init__(self, host, port, callback_threads=1, callback_queue_size=0,
+                 callback_queue_policy=CallbackQueue.QUEUE_BLOCK, auto_reconnect=False):
         """
         Creates an IP connection to the Brick Daemon with the given *host*
         and *port*. With the IP connection itself it is possible to enumerate the
         available devices. Other then that it is only used to add Bricks and
         Bricklets to the connection.
+
+        Callbacks are called from a pool of *callback_threads* threads that
+        share one queue. The callbacks of a device are called one at a time
+        and in order, while the other threads call the callbacks of the other
+        devices, so a slow callback only delays its own device. If
+        *callback_queue_size* is not 0, at most that many callbacks of all
+        devices are queued. *callback_queue_policy* selects what happens if
+        the queue is full, see :py:class:`CallbackQueue`.
+
+        If *auto_reconnect* is true, a lost connection is not destroyed. It
+        is opened again with increasing delays between the attempts (from
+        RECONNECT_DELAY_MIN up to RECONNECT_DELAY_MAX seconds), all devices
+        are added again at once and their callback configuration (periods,
+        thresholds and debounce period) is sent again. Requests fail with
+        Error.NO_CONNECT until then, see
+        :py:func:`register_connection_callback <IPConnection.register_connection_callback>`.
         """
 
-        self.pending_add_device = None
+        self.host = host
+        self.port = port
+        self.auto_reconnect = auto_reconnect
+        self.pending_add_devices = {} # UID -> (device, queue) waiting for its stack ID
         self.add_device_lock = Lock()
         self.devices = {}
         self.enumerate_callback = None
+        self.connection_callback = None
+        self.batch_local = local()
+        self.recorder = None
+        self.statistics = None
+        self.reconnect_condition = Condition()
+        self.reconnect_count = 0
+        self.readding_devices = []
 
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((host, port))
+        self.sock = self.open_socket(host, port)
+        self.connected = True
 
         self.thread_receive_flag = True
         self.thread_receive = Thread(target=self.receive_loop)
@@ -165,78 +1008,331 @@ class IPConnection:
         self.thread_receive.start()
 
         self.thread_callback_flag = True
-        self.thread_callback = Thread(target=self.callback_loop)
-        self.thread_callback.daemon = True
-        self.thread_callback.start()
+        self.callback_queue = CallbackQueue(callback_queue_size, callback_queue_policy)
+        self.thread_callbacks = []
+        for i in range(max(1, callback_threads)):
+            thread_callback = Thread(target=self.callback_loop)
+            thread_callback.daemon = True
+            thread_callback.start()
+
+            self.thread_callbacks.append(thread_callback)
+
+        self.thread_callback = self.thread_callbacks[0]
+
+    def open_socket(self, host, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((host, port))
+
+        return sock
+
+    def start_capture(self, filename):
+        """
+        Starts to append all received and sent packets with a timestamp to
+        the capture log *filename*. The log can be replayed with
+        :py:class:`ReplayIPConnection`.
+        """
+
+        recorder = PacketRecorder(filename)
+        self.stop_capture()
+        self.recorder = recorder
+
+    def stop_capture(self):
+        """
+        Stops the capture started by :py:func:`start_capture <IPConnection.start_capture>`.
+        """
+
+        recorder = self.recorder
+        self.recorder = None
+
+        if recorder is not None:
+            recorder.close()
+
+    def start_statistics(self):
+        """
+        Starts to collect request latencies, timeouts, traffic, callback
+        queue depths and callback handler durations. Returns the
+        :py:class:`Statistics` object, it is updated while the IP connection
+        is used and :py:func:`Statistics.get_report` summarizes it.
+        """
+
+        self.statistics = Statistics()
+        return self.statistics
+
+    def stop_statistics(self):
+        """
+        Stops the collection started by :py:func:`start_statistics <IPConnection.start_statistics>`.
+        """
+
+        self.statistics = None
+
+    def send_data(self, data):
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.record(PacketRecorder.SENT, data)
+
+        statistics = self.statistics
+        if statistics is not None:
+            statistics.add_sent(data)
+
+        self.sock.sendall(data)
 
     def receive_loop(self):
-        if sys.hexversion < 0x03000000:
-            pending_data = ''
-        else:
-            pending_data = bytes()
+        while self.thread_receive_flag:
+            error = self.receive_packets()
+
+            if not self.thread_receive_flag:
+                return
+
+            if not self.auto_reconnect:
+                if error is None:
+                    error = 'Socket disconnected by Server'
+
+                sys.stderr.write(error + ', destroying IPConnection\n')
+                self.destroy()
+                return
+
+            if error is not None:
+                sys.stderr.write(error + ', reconnecting\n')
+
+            self.reconnect()
+
+    def receive_packets(self):
+        # Receive into a reusable buffer and parse all complete packets in
+        # place, only an incomplete packet at the end is ever moved. Returns
+        # None when the connection is closed or an error message if the
+        # stream is corrupt, a TCP stream can't be resynchronized
+        data = bytearray(8192)
+        view = memoryview(data)
+        start = 0 # begin of the first unparsed packet
+        end = 0 # end of the received data
 
         while self.thread_receive_flag:
-            data = self.sock.recv(8192)
+            if end == len(data):
+                data[0:end - start] = data[start:end]
+                end -= start
+                start = 0
 
-            if len(data) == 0:
-                if self.thread_receive_flag:
-                    sys.stderr.write('Socket disconnected by Server, destroying IPConnection\n')
-                    self.destroy()
+            try:
+                received = self.sock.recv_into(view[end:])
+            except socket.error:
                 return
 
-            pending_data += data
+            if received == 0:
+                return
+
+            end += received
+            packets = 0
 
             while True:
-                if len(pending_data) < 4:
+                if end - start < 4:
                     # Wait for complete header
                     break
 
-                length = get_length_from_data(pending_data)
+                length = data[start + 2] | (data[start + 3] << 8)
+
+                if length < 4 or length > len(data):
+                    return 'Received packet with invalid length {0}'.format(length)
 
-                if len(pending_data) < length:
+                if end - start < length:
                     # Wait for complete packet
                     break
 
-                packet = pending_data[0:length]
-                pending_data = pending_data[length:]
+                packet = bytes(data[start:start + length])
+                start += length
+                packets += 1
+
+                recorder = self.recorder
+                if recorder is not None:
+                    recorder.record(PacketRecorder.RECEIVED, packet)
 
                 self.handle_response(packet)
 
+            statistics = self.statistics
+            if statistics is not None:
+                statistics.add_received(received, packets)
+
+            if start == end:
+                start = 0
+                end = 0
+
+    def reconnect(self):
+        self.connected = False
+        self.reconnect_count += 1
+        try:
+            self.sock.close()
+        except socket.error:
+            pass
+
+        # Devices of an unfinished re-add are tried again
+        devices = list(self.readding_devices)
+        for device in self.devices.values():
+            if not device in devices:
+                devices.append(device)
+
+        self.fail_pending_requests(devices)
+        self.call_connection_callback(IPConnection.CONNECTION_DISCONNECTED)
+
+        delay = IPConnection.RECONNECT_DELAY_MIN
+        sock = None
+        while self.thread_receive_flag:
+            try:
+                sock = self.open_socket(self.host, self.port)
+                break
+            except socket.error:
+                pass
+
+            self.reconnect_condition.acquire()
+            try:
+                if self.thread_receive_flag:
+                    self.reconnect_condition.wait(delay)
+            finally:
+                self.reconnect_condition.release()
+
+            delay = min(delay * 2, IPConnection.RECONNECT_DELAY_MAX)
+
+        if not self.thread_receive_flag:
+            if sock is not None:
+                sock.close()
+            return
+
+        self.sock = sock
+        self.devices = {}
+        self.readding_devices = devices
+
+        # The responses are received by this thread, so the devices are
+        # added again by another one
+        thread = Thread(target=self.readd_devices, args=(devices, self.reconnect_count))
+        thread.daemon = True
+        thread.start()
+
+    def readd_devices(self, devices, reconnect_count):
+        try:
+            missing = self.add_devices_at_once(devices)
+        except socket.error:
+            return # lost again, the next reconnect tries again
+
+        if reconnect_count != self.reconnect_count or not self.thread_receive_flag:
+            return
+
+        requests = []
+
+        for device in devices:
+            if device in missing:
+                # Has to be added again with add_device
+                device.ipcon = None
+                continue
+
+            device.ipcon = self
+            device.invalidate_cache()
+            for function_id in sorted(device.callback_configuration.keys()):
+                request = device.callback_configuration[function_id]
+                requests.append(struct.pack('<B', device.stack_id) + request[1:])
+
+        if len(requests) > 0:
+            try:
+                self.send_data(b''.join(requests))
+            except socket.error:
+                return
+
+        if reconnect_count != self.reconnect_count or not self.thread_receive_flag:
+            # Lost again in the meantime
+            return
+
+        self.readding_devices = []
+        self.connected = True
+        self.call_connection_callback(IPConnection.CONNECTION_CONNECTED)
+
+    def fail_pending_requests(self, devices):
+        for device in devices:
+            device.response_lock.acquire()
+            try:
+                for waiters in device.pending_responses.values():
+                    while len(waiters) > 0:
+                        waiters.popleft().put(None)
+            finally:
+                device.response_lock.release()
+
+    def call_connection_callback(self, state):
+        if self.connection_callback is not None:
+            self.connection_callback(state)
+
+    def register_connection_callback(self, callback):
+        """
+        Registers a function that is called with CONNECTION_DISCONNECTED if
+        the connection is lost and with CONNECTION_CONNECTED after it was
+        opened again and the devices were added again (only with
+        *auto_reconnect*). Devices that couldn't be added again have to be
+        added with :py:func:`add_device <IPConnection.add_device>` later on.
+        The function is called from an internal thread and should return
+        quickly.
+        """
+
+        self.connection_callback = callback
+
     def callback_loop(self):
         while self.thread_callback_flag:
-            data = self.callback_queue.get()
+            taken = self.callback_queue.get()
 
-            if not self.thread_callback_flag:
+            if not self.thread_callback_flag or taken is None:
                 return
 
-            if data is None:
-                continue
+            group, data = taken
+            try:
+                self.dispatch_callback(data)
+            finally:
+                # Next callback of this device can be called now
+                self.callback_queue.done(group)
+
+    def dispatch_callback(self, data):
+        statistics = self.statistics
+        if statistics is not None:
+            started = get_timestamp()
+
+        if isinstance(data, tuple):
+            # Full block of a block callback
+            stack_id, function_id, block_buffer, block = data
+            block_buffer.dispatch(block)
+
+            if statistics is not None and stack_id in self.devices:
+                statistics.add_callback(self.devices[stack_id], function_id,
+                                        get_timestamp() - started)
+            return
 
-            stack_id = get_stack_id_from_data(data)
-            function_id = get_function_id_from_data(data)
-            length = get_length_from_data(data)
-            
-            if function_id == IPConnection.FUNCTION_ENUMERATE_CALLBACK:
-                data = data[:length]
-                data = data[4:]
+        stack_id = get_stack_id_from_data(data)
+        function_id = get_function_id_from_data(data)
+        length = get_length_from_data(data)
+        
+        if function_id == IPConnection.FUNCTION_ENUMERATE_CALLBACK:
+            data = data[:length]
+            data = data[4:]
 
-                uid, name, stack_id, new = self.data_to_return(data, 'Q 40s B ?')
+            uid, name, stack_id, new = self.data_to_return(data, 'Q 40s B ?')
 
-                # Remove \0 from end of string
-                name = name.replace(chr(0), '')
+            # Remove \0 from end of string
+            if sys.hexversion < 0x03000000:
+                name = name.replace(chr(0), '').decode()
+            else:
+                name = name.decode('ascii').replace(chr(0), '')
 
-                self.enumerate_callback(base58encode(uid), name.decode(), stack_id, new)
-                continue
+            self.enumerate_callback(base58encode(uid), name, stack_id, new)
+            return
 
-            device = self.devices[stack_id]
-            if function_id in device.registered_callbacks:
-                form = device.callback_formats[function_id]
-                if len(form) == 0:
-                    device.registered_callbacks[function_id]()
-                elif len(form) == 1:
-                    device.registered_callbacks[function_id](self.data_to_return(data[4:], form))
-                else:
-                    device.registered_callbacks[function_id](*self.data_to_return(data[4:], form))
+        device = self.devices.get(stack_id)
+        if device is None:
+            # Queued before the connection was lost
+            return
+
+        if function_id in device.registered_callbacks:
+            form = get_format(device.callback_formats[function_id])
+            if len(form.kinds) == 0:
+                device.registered_callbacks[function_id]()
+            elif len(form.kinds) == 1:
+                device.registered_callbacks[function_id](form.unpack(data[4:]))
+            else:
+                device.registered_callbacks[function_id](*form.unpack(data[4:]))
+
+            if statistics is not None:
+                statistics.add_callback(device, function_id, get_timestamp() - started)
 
     def destroy(self):
         """
@@ -244,15 +1340,22 @@ class IPConnection:
         and the threads of the IP connection terminated.
         """
 
-        # End callback thread
+        # End callback threads
         self.thread_callback_flag = False
-        self.callback_queue.put(None) # unblock callback_loop
+        self.callback_queue.close() # unblock callback_loop and queue_callback
 
-        if current_thread() is not self.thread_callback:
-            self.thread_callback.join()
+        for thread_callback in self.thread_callbacks:
+            if current_thread() is not thread_callback:
+                thread_callback.join()
 
         # End receive thread
         self.thread_receive_flag = False
+        self.reconnect_condition.acquire()
+        try:
+            self.reconnect_condition.notify_all()
+        finally:
+            self.reconnect_condition.release()
+
         try:
             self.sock.shutdown(socket.SHUT_RDWR)
         except socket.error:
@@ -262,24 +1365,18 @@ class IPConnection:
         if current_thread() is not self.thread_receive:
             self.thread_receive.join()
 
-    def data_to_return(self, data, form):
-        ret = []
-        for f in form.split(' '):
-            f = '<' + f
-            length = struct.calcsize(f)
+        self.stop_capture()
 
-            x = struct.unpack(f, data[:length])
-            if len(x) > 1:
-                ret.append(x)
-            else:
-                ret.append(x[0])
+        # Deliver the values that don't fill a block yet, no thread
+        # appends to the block buffers anymore
+        for device in list(self.devices.values()):
+            for block_buffer in list(device.registered_block_callbacks.values()):
+                block = block_buffer.flush()
+                if block is not None:
+                    block_buffer.dispatch(block)
 
-            data = data[length:]
-       
-        if len(ret) == 1:
-            return ret[0] 
-
-        return ret
+    def data_to_return(self, data, form):
+        return get_format(form).unpack(data)
 
     def join_thread(self):
         """
@@ -290,60 +1387,221 @@ class IPConnection:
         the IP connection was created in a threads.
         """
 
-        self.thread_callback.join()
+        for thread_callback in self.thread_callbacks:
+            thread_callback.join()
         self.thread_receive.join()
 
-    def send_request(self, device, function_id, data, form, form_ret):
-        device.write_lock.acquire()
-       
-        length = struct.pack('<H', struct.calcsize('<' + form) + 4)
-        if sys.hexversion < 0x03000000:
-            request = chr(device.stack_id) + chr(function_id) + length
-        else:
-            request = bytes([device.stack_id, function_id]) + length
-
-        for f, d in zip(form.split(' '), data):
-            if len(f) > 1 and not 's' in f:
-                request += struct.pack('<' + f, *d)
-            elif 's' in f:
-                if sys.hexversion < 0x03000000:
-                    if type(d) == types.UnicodeType:
-                        request += struct.pack('<' + f, d.encode('ascii'))
-                    else:
-                        request += struct.pack('<' + f, d)
+    def add_waiter(self, device, function_id):
+        waiter = Queue()
+
+        device.response_lock.acquire()
+        try:
+            if not function_id in device.pending_responses:
+                device.pending_responses[function_id] = deque()
+            device.pending_responses[function_id].append(waiter)
+            waiter.stale_drops = device.stale_drops.get(function_id, 0)
+        finally:
+            device.response_lock.release()
+
+        return waiter
+
+    def remove_waiter(self, device, function_id, waiter):
+        device.response_lock.acquire()
+        try:
+            if waiter in device.pending_responses[function_id]:
+                device.pending_responses[function_id].remove(waiter)
+        finally:
+            device.response_lock.release()
+
+    def abandon_waiter(self, device, function_id, waiter):
+        # The request was sent, its response might still arrive. Unless a
+        # StaleResponse ahead of it dropped a response in the meantime, that
+        # was most likely this one
+        device.response_lock.acquire()
+        try:
+            waiters = device.pending_responses[function_id]
+            if waiter in waiters:
+                if waiter.stale_drops != device.stale_drops.get(function_id, 0):
+                    waiters.remove(waiter)
                 else:
-                    if isinstance(d, str):
-                        request += struct.pack('<' + f, bytes(d, 'ascii'))
-                    else:
-                        request += struct.pack('<' + f, d)
-            else:
-                request += struct.pack('<' + f, d)
+                    waiters[list(waiters).index(waiter)] = StaleResponse(IPConnection.RESPONSE_TIMEOUT)
+        finally:
+            device.response_lock.release()
 
-        if len(form_ret) != 0:
-            device.expected_response_function_id = function_id
+    def send_request(self, device, function_id, data, form, form_ret):
+        form = get_format(form)
+        form_ret = get_format(form_ret)
+        request = form.pack(device.stack_id, function_id, data)
+
+        batch = getattr(self.batch_local, 'batch', None)
+        if batch is not None:
+            if function_id in device.cached_getters:
+                # Batched setters are not cached, the getter asks the device
+                device.invalidate_cache()
+            if function_id in device.callback_setters:
+                device.callback_configuration[function_id] = request
+            batch.requests.append((device, function_id, request, form_ret))
+            return
+
+        if self.auto_reconnect and not self.connected:
+            raise Error(Error.NO_CONNECT, 'Not connected, reconnecting')
+
+        version = None
+        if device.cache is not None and function_id in device.cache_getter_ids:
+            value = device.get_cached_value(function_id)
+            if value is not None:
+                return value
+            version = device.cache_version
 
+        waiter = None
+
+        # Only sending is serialized, other requests to the same or other
+        # devices can be sent while this one waits for its response.
+        # Responses are matched to waiters in FIFO order per function ID
+        device.write_lock.acquire()
         try:
-            self.sock.send(request)
-        except socket.error:
-            self.destroy()
+            if form_ret.size != 0:
+                waiter = self.add_waiter(device, function_id)
 
-        if len(form_ret) == 0:
+            sent = get_timestamp()
+            try:
+                self.send_data(request)
+            except socket.error:
+                if self.auto_reconnect:
+                    if waiter is not None:
+                        self.remove_waiter(device, function_id, waiter)
+                    raise Error(Error.NO_CONNECT, 'Connection lost')
+
+                self.destroy()
+        finally:
             device.write_lock.release()
+
+        if function_id in device.callback_setters:
+            device.callback_configuration[function_id] = request
+
+        if function_id in device.cached_getters:
+            # Only decoded if there is a cache to store the value in
+            if device.cache is not None:
+                getter_id, getter_form = device.cached_getters[function_id]
+                device.set_cached_value(getter_id, getter_form.unpack(request[4:]))
+        elif function_id == IPConnection.FUNCTION_RESET:
+            # Resetting a Brick resets its whole stack
+            for other in list(self.devices.values()):
+                other.invalidate_cache()
+
+        if waiter is None:
             return
-        
+
+        statistics = self.statistics
+
         try:
-            response = device.response_queue.get(True, IPConnection.RESPONSE_TIMEOUT)
+            response = waiter.get(True, IPConnection.RESPONSE_TIMEOUT)
         except Empty:
-            device.write_lock.release()
+            self.abandon_waiter(device, function_id, waiter)
+            if statistics is not None:
+                statistics.add_timeout(device, function_id)
             msg = 'Did not receive response for function ' + str(function_id) +  ' in time'
             raise Error(Error.TIMEOUT, msg)
 
+        if response is None:
+            raise Error(Error.NO_CONNECT, 'Connection lost')
+
+        if statistics is not None:
+            statistics.add_request(device, function_id, get_timestamp() - sent)
+
+        result = form_ret.unpack(response)
+
+        if version is not None:
+            device.set_cached_value(function_id, result, version)
+
+        return result
+
+    def send_batch(self, requests):
+        if self.auto_reconnect and not self.connected:
+            raise Error(Error.NO_CONNECT, 'Not connected, reconnecting')
+
+        devices = {}
+        for device, function_id, request, form_ret in requests:
+            devices[device.stack_id] = device
+
+        # Lock in stack ID order, so concurrent batches can't deadlock
+        locks = [devices[stack_id].write_lock for stack_id in sorted(devices.keys())]
+        waiters = []
+
+        for lock in locks:
+            lock.acquire()
         try:
-            device.write_lock.release()
-        except ValueError:
-            self.destroy()
+            for device, function_id, request, form_ret in requests:
+                if form_ret.size != 0:
+                    waiters.append(self.add_waiter(device, function_id))
+                else:
+                    waiters.append(None)
+
+            sent = get_timestamp()
+            try:
+                self.send_data(b''.join([request[2] for request in requests]))
+            except socket.error:
+                if self.auto_reconnect:
+                    for i, waiter in enumerate(waiters):
+                        if waiter is not None:
+                            self.remove_waiter(requests[i][0], requests[i][1], waiter)
+                    raise Error(Error.NO_CONNECT, 'Connection lost')
+
+                self.destroy()
+        finally:
+            for lock in locks:
+                lock.release()
 
-        return self.data_to_return(response, form_ret)
+        # All responses share one timeout
+        deadline = time.time() + IPConnection.RESPONSE_TIMEOUT
+        results = []
+        statistics = self.statistics
+
+        for i, (device, function_id, request, form_ret) in enumerate(requests):
+            if waiters[i] is None:
+                results.append(None)
+                continue
+
+            try:
+                response = waiters[i].get(True, max(0, deadline - time.time()))
+            except Empty:
+                for j in range(i, len(requests)):
+                    if waiters[j] is not None:
+                        self.abandon_waiter(requests[j][0], requests[j][1], waiters[j])
+
+                if statistics is not None:
+                    statistics.add_timeout(device, function_id)
+
+                msg = 'Did not receive response for function ' + str(function_id) +  ' in time'
+                raise Error(Error.TIMEOUT, msg)
+
+            if response is None:
+                raise Error(Error.NO_CONNECT, 'Connection lost')
+
+            if statistics is not None:
+                statistics.add_request(device, function_id, get_timestamp() - sent)
+
+            results.append(form_ret.unpack(response))
+
+        return results
+
+    def batch(self):
+        """
+        Returns a context manager that collects all requests made by the
+        current thread in its block. When the block ends they are sent with
+        a single socket write and their responses are collected with one
+        overall timeout. Calls in the block return None, the results are
+        available in the *results* list of the batch afterwards, in the
+        order of the calls::
+
+         with ipcon.batch() as batch:
+             temperature.get_temperature()
+             imu.get_all_data()
+
+         temperature, all_data = batch.results
+        """
+
+        return Batch(self)
 
     def handle_response(self, packet):
         function_id = get_function_id_from_data(packet)
@@ -357,23 +1615,73 @@ class IPConnection:
         stack_id = get_stack_id_from_data(packet)
         if not stack_id in self.devices:
             # Response from an unknown device, ignoring it
+            statistics = self.statistics
+            if statistics is not None:
+                statistics.add_unknown_device_packet()
             return
 
         device = self.devices[stack_id]
-        if device.expected_response_function_id == function_id:
-            device.response_queue.put(packet[4:])
+        waiter = None
+        device.response_lock.acquire()
+        try:
+            waiters = device.pending_responses.get(function_id, ())
+            now = time.time()
+
+            # A timed out request that got no response at all
+            while len(waiters) > 0 and isinstance(waiters[0], StaleResponse) and waiters[0].expires < now:
+                waiters.popleft()
+
+            if len(waiters) > 0:
+                waiter = waiters.popleft()
+
+                if isinstance(waiter, StaleResponse):
+                    device.stale_drops[function_id] = device.stale_drops.get(function_id, 0) + 1
+        finally:
+            device.response_lock.release()
+
+        if waiter is not None:
+            waiter.put(packet[4:])
             return
     
+        if function_id in device.registered_block_callbacks:
+            block_buffer = device.registered_block_callbacks[function_id]
+            block = block_buffer.append(packet[4:])
+            if block is not None:
+                self.queue_callback(stack_id, (stack_id, function_id, block_buffer, block), None)
+            return
+
         if function_id in device.registered_callbacks:
-            self.callback_queue.put(packet)
+            # Only values sent in a period can be coalesced, an event like
+            # an interrupt or a reached threshold must not be lost
+            key = None
+            if function_id in device.periodic_callbacks:
+                key = (stack_id, function_id)
+
+            self.queue_callback(stack_id, packet, key)
             return
 
         # Response seems to be OK, but can't be handled, most likely
         # a callback without registered function
 
+    def queue_callback(self, stack_id, item, key):
+        # Grouped by stack ID, to keep the order per device
+        dropped = self.callback_queue.put(item, key, stack_id)
+
+        statistics = self.statistics
+        if statistics is not None:
+            statistics.add_queued(self.callback_queue.qsize(), dropped)
+
     def handle_enumerate(self, packet):
+        # A device that is reported as new again was reset or replugged
+        uid, new = struct.unpack('<Q', packet[4:12])[0], packet[-1:] != b'\0'
+        if new:
+            for device in list(self.devices.values()):
+                if device.uid == uid:
+                    device.invalidate_cache()
+
         if self.enumerate_callback is not None:
-            self.callback_queue.put(packet)
+            # Enumerate callbacks are events, they are never coalesced
+            self.queue_callback(get_stack_id_from_data(packet), packet, None)
 
     def enumerate(self, callback):
         """
@@ -404,29 +1712,32 @@ class IPConnection:
                              IPConnection.FUNCTION_ENUMERATE]) + \
                       struct.pack('<H', IPConnection.ENUMERATE_LENGTH)
 
-        self.sock.send(request)
+        self.send_data(request)
 
     def handle_add_device(self, packet):
-        if self.pending_add_device == None:
+        value = struct.unpack('<BBHQ 3B 40s B', packet)
+
+        # Several devices can wait for their stack ID at once
+        pending = self.pending_add_devices.get(value[3])
+        if pending is None:
             return
 
-        value = struct.unpack('<BBHQ 3B 40s B', packet)
+        device, waiter = pending
 
-        if self.pending_add_device.uid == value[3]:
-            if sys.hexversion < 0x03000000:
-                name = value[7].replace(chr(0), '').decode()
-            else:
-                name = value[7].decode('ascii').replace(chr(0), '')
+        if sys.hexversion < 0x03000000:
+            name = value[7].replace(chr(0), '').decode()
+        else:
+            name = value[7].decode('ascii').replace(chr(0), '')
 
-            i = name.rfind(' ')
-            if i < 0 or name[0:i].replace('-', ' ') != self.pending_add_device.expected_name.replace('-', ' '):
-                return
+        i = name.rfind(' ')
+        if i < 0 or name[0:i].replace('-', ' ') != device.expected_name.replace('-', ' '):
+            return
 
-            self.pending_add_device.firmware_version = [value[4], value[5], value[6]]
-            self.pending_add_device.name = name
-            self.pending_add_device.stack_id = value[8]
-            self.devices[value[8]] = self.pending_add_device
-            self.pending_add_device.response_queue.put(None)
+        device.firmware_version = [value[4], value[5], value[6]]
+        device.name = name
+        device.stack_id = value[8]
+        self.devices[value[8]] = device
+        waiter.put(None)
 
     def add_device(self, device):
         """
@@ -435,35 +1746,86 @@ class IPConnection:
         this can be found in the API documentation for every Brick and Bricklet.
         """
 
-        if sys.hexversion < 0x03000000:
-            request = chr(IPConnection.BROADCAST_ADDRESS) + \
-                      chr(IPConnection.FUNCTION_GET_STACK_ID) + \
-                      struct.pack('<H', IPConnection.GET_STACK_ID_LENGTH) + \
-                      struct.pack('<Q', device.uid)
-        else:
-            request = bytes([IPConnection.BROADCAST_ADDRESS,
-                             IPConnection.FUNCTION_GET_STACK_ID]) + \
-                      struct.pack('<H', IPConnection.GET_STACK_ID_LENGTH) + \
-                      struct.pack('<Q', device.uid)
+        error = self.add_devices([device])[0]
+        if error is not None:
+            raise error
 
-        self.add_device_lock.acquire()
-        try:
-            self.pending_add_device = device
-            self.sock.send(request)
+    def add_devices(self, devices):
+        """
+        Adds several devices at once. The stack IDs of all devices are
+        requested with a single write and the answers are awaited with one
+        overall timeout, so adding many devices takes about as long as adding
+        one. Returns a list with an entry per device, in the same order:
+        None if the device was added or the :py:class:`Error` that
+        :py:func:`add_device <IPConnection.add_device>` would have raised.
+        """
 
-            try:
-                device.response_queue.get(True, IPConnection.RESPONSE_TIMEOUT)
-            except Empty:
+        if self.auto_reconnect and not self.connected:
+            raise Error(Error.NO_CONNECT, 'Not connected, reconnecting')
+
+        missing = self.add_devices_at_once(devices)
+        errors = []
+
+        for device in devices:
+            if device in missing:
                 msg = 'Could not add device ' + \
                       str(base58encode(device.uid)) + \
                       ', timeout'
-                raise Error(Error.TIMEOUT, msg)
+                errors.append(Error(Error.TIMEOUT, msg))
+                continue
 
             device.ipcon = self
+            device.invalidate_cache()
+            errors.append(None)
+
+        return errors
+
+    def add_devices_at_once(self, devices):
+        # Requests the stack IDs of all devices with a single write and
+        # waits for them with one overall timeout, returns the devices that
+        # didn't answer. Answers are matched by UID in handle_add_device
+        requests = []
+        pendings = []
+
+        self.add_device_lock.acquire()
+        try:
+            for device in devices:
+                # A new queue per try, late answers of an earlier try go
+                # nowhere
+                pending = (device, Queue())
+                pendings.append(pending)
+                self.pending_add_devices[device.uid] = pending
+                requests.append(struct.pack('<BBHQ',
+                                            IPConnection.BROADCAST_ADDRESS,
+                                            IPConnection.FUNCTION_GET_STACK_ID,
+                                            IPConnection.GET_STACK_ID_LENGTH,
+                                            device.uid))
         finally:
-            self.pending_add_device = None
             self.add_device_lock.release()
 
+        missing = []
+
+        try:
+            self.send_data(b''.join(requests))
+
+            deadline = time.time() + IPConnection.RESPONSE_TIMEOUT
+
+            for device, waiter in pendings:
+                try:
+                    waiter.get(True, max(0, deadline - time.time()))
+                except Empty:
+                    missing.append(device)
+        finally:
+            self.add_device_lock.acquire()
+            try:
+                for pending in pendings:
+                    if self.pending_add_devices.get(pending[0].uid) is pending:
+                        del self.pending_add_devices[pending[0].uid]
+            finally:
+                self.add_device_lock.release()
+
+        return missing
+
     def write_bricklet_plugin(self, device, port, plugin):
         position = 0
 
@@ -530,3 +1892,172 @@ class IPConnection:
                                     'Q')
 
         return base58encode(uid_int)
+
+class ReplaySocket:
+    """
+    Replaces the socket of a :py:class:`ReplayIPConnection`. recv_into plays
+    back the received packets of a capture log, requests are dropped except
+    for GET_STACK_ID, which is answered with the recorded response.
+    """
+
+    def __init__(self, filename, speed):
+        self.speed = speed
+        self.file = open(filename, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.records = [] # (timestamp, offset, length)
+        self.stack_ids = {} # UID -> recorded GET_STACK_ID response
+
+        for timestamp, direction, offset, length in get_capture_index(self.data):
+            if direction != PacketRecorder.RECEIVED:
+                continue
+
+            packet = self.data[offset:offset + length]
+            if get_function_id_from_data(packet) == IPConnection.FUNCTION_GET_STACK_ID:
+                self.stack_ids[packet[4:12]] = packet
+            else:
+                self.records.append((timestamp, offset, length))
+
+        self.position = 0 # next record
+        self.offset = 0 # already returned bytes of the next record
+        self.answers = b''
+        self.start_time = None
+        self.finished = False
+        self.closed = False
+        self.condition = Condition()
+
+    def start(self):
+        self.condition.acquire()
+        try:
+            self.start_time = get_timestamp()
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    def wait_finished(self):
+        self.condition.acquire()
+        try:
+            while not self.finished and not self.closed:
+                self.condition.wait()
+        finally:
+            self.condition.release()
+
+    def sendall(self, data):
+        self.condition.acquire()
+        try:
+            while len(data) >= 4:
+                length = get_length_from_data(data)
+                if get_function_id_from_data(data) == IPConnection.FUNCTION_GET_STACK_ID and \
+                   data[4:12] in self.stack_ids:
+                    self.answers += self.stack_ids[data[4:12]]
+                    self.condition.notify_all()
+                data = data[length:]
+        finally:
+            self.condition.release()
+
+    def get_delay(self, timestamp):
+        if self.speed is None or self.speed <= 0:
+            return 0
+
+        due = self.start_time + (timestamp - self.records[0][0]) / self.speed
+        return due - get_timestamp()
+
+    def recv_into(self, view):
+        self.condition.acquire()
+        try:
+            while not self.closed:
+                # Answers are only inserted between records
+                if len(self.answers) > 0 and self.offset == 0:
+                    length = min(len(self.answers), len(view))
+                    view[0:length] = self.answers[:length]
+                    self.answers = self.answers[length:]
+                    return length
+
+                if self.start_time is None:
+                    self.condition.wait()
+                    continue
+
+                if self.position == len(self.records):
+                    self.finished = True
+                    self.condition.notify_all()
+                    self.condition.wait()
+                    continue
+
+                delay = self.get_delay(self.records[self.position][0])
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+
+                # Return all packets that are due, as far as they fit
+                length = 0
+                while self.position < len(self.records) and length < len(view):
+                    timestamp, offset, size = self.records[self.position]
+                    if length > 0 and self.get_delay(timestamp) > 0:
+                        break
+
+                    chunk = min(size - self.offset, len(view) - length)
+                    start = offset + self.offset
+                    view[length:length + chunk] = self.data[start:start + chunk]
+                    length += chunk
+                    self.offset += chunk
+
+                    if self.offset == size:
+                        self.position += 1
+                        self.offset = 0
+
+                return length
+
+            return 0
+        finally:
+            self.condition.release()
+
+    def shutdown(self, how):
+        self.close()
+
+    def close(self):
+        self.condition.acquire()
+        try:
+            if not self.closed:
+                self.closed = True
+                self.data.close()
+                self.file.close()
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+class ReplayIPConnection(IPConnection):
+    """
+    IP connection that plays back a capture log recorded with
+    :py:func:`IPConnection.start_capture` instead of talking to a Brick
+    Daemon. Received packets go through the normal receive path, so callbacks
+    and block callbacks behave as with the original connection.
+
+    *speed* scales the recorded timing, 1.0 is real-time, 2.0 twice as fast
+    and 0 replays as fast as possible.
+    """
+
+    def __init__(self, filename, speed=1.0, callback_threads=1, callback_queue_size=0,
+                 callback_queue_policy=CallbackQueue.QUEUE_BLOCK):
+        self.speed = speed
+        IPConnection.__init__(self, filename, None, callback_threads,
+                              callback_queue_size, callback_queue_policy)
+
+    def open_socket(self, filename, port):
+        return ReplaySocket(filename, self.speed)
+
+    def start_replay(self):
+        """
+        Starts the playback. Add the devices and register the callbacks
+        first, devices are added with the recorded GET_STACK_ID responses.
+        """
+
+        self.sock.start()
+
+    def wait_replay(self):
+        """
+        Waits until all packets were played back and all queued callbacks
+        were taken by the callback threads.
+        """
+
+        self.sock.wait_finished()
+
+        self.callback_queue.wait_empty()
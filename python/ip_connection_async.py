@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+# Copyright (C) 2012 Matthias Bolte <matthias@tinkerforge.com>
+# Copyright (C) 2011 Olaf Lüke <olaf@tinkerforge.com>
+#
+# Redistribution and use in source and binary forms of this file,
+# with or without modification, are permitted.
+
+# asyncio variant of ip_connection.py, requires Python 3.7 or newer. Device
+# modules for it are created with "generate_python_bindings.py --async"
+
+import asyncio
+from collections import deque
+import struct
+import time
+
+from .ip_connection import Error, Format, GetVersion, DeviceConCheckerMeta, \
+                           StaleResponse, get_format, base58encode, base58decode, \
+                           get_stack_id_from_data, get_function_id_from_data
+
+class CallbackStream:
+    """
+    Asynchronous iterator over the values of a callback. If *maxsize* values
+    are queued already the oldest one is dropped. The iteration ends when the
+    stream is closed or the IP connection is lost.
+    """
+
+    def __init__(self, streams, maxsize=0):
+        self.streams = streams
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+
+        streams.append(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.closed and self.queue.empty():
+            raise StopAsyncIteration
+
+        value = await self.queue.get()
+
+        if value is self:
+            raise StopAsyncIteration
+
+        return value
+
+    def put(self, value):
+        if self.queue.full():
+            self.queue.get_nowait()
+
+        self.queue.put_nowait(value)
+
+    def close(self):
+        """
+        Stops the stream, values that are already queued are still returned.
+        """
+
+        if self.closed:
+            return
+
+        self.closed = True
+        self.streams.remove(self)
+        self.put(self) # end pending iterations
+
+class Device(DeviceConCheckerMeta):
+    def __init__(self, uid):
+        self.uid = base58decode(uid)
+        self.ipcon = None
+        self.stack_id = 0
+        self.expected_name = ''
+        self.name = ''
+        self.firmware_version = [0, 0, 0]
+        self.binding_version = [0, 0, 0]
+        self.callback_formats = {}
+        self.callback_streams = {} # callback ID -> list of CallbackStream
+        self.pending_responses = {} # function ID -> FIFO of futures
+        self.stale_drops = {} # function ID -> number of responses dropped by a StaleResponse
+
+    def get_version(self):
+        """
+        Returns the name (including the hardware version), the firmware version
+        and the binding version of the device. The firmware and binding versions are
+        given in arrays of size 3 with the syntax [major, minor, revision].
+        """
+        return GetVersion(self.name, self.firmware_version, self.binding_version)
+
+    def callback_stream(self, id, maxsize=0):
+        """
+        Returns an asynchronous iterator over the values of the callback with
+        ID *id*. Callbacks with one value yield the value itself, callbacks
+        with more values yield a list of them.
+        """
+        if not id in self.callback_streams:
+            self.callback_streams[id] = []
+
+        return CallbackStream(self.callback_streams[id], maxsize)
+
+class IPConnection(asyncio.BufferedProtocol):
+    FUNCTION_GET_STACK_ID = 255
+    FUNCTION_ENUMERATE = 254
+    FUNCTION_ENUMERATE_CALLBACK = 253
+
+    BROADCAST_ADDRESS = 0
+    ENUMERATE_LENGTH = 4
+    GET_STACK_ID_LENGTH = 12
+
+    RESPONSE_TIMEOUT = 2.5
+
+    FORMAT_GET_STACK_ID = Format('Q 3B 40s B')
+    FORMAT_ENUMERATE_CALLBACK = Format('Q 40s B ?')
+
+    def __init__(self, host, port):
+        """
+        Creates an IP connection to the Brick Daemon with the given *host*
+        and *port*. The connection is established by awaiting
+        :py:func:`connect <IPConnection.connect>`, all IP connections
+        are driven by the running event loop.
+        """
+
+        self.host = host
+        self.port = port
+        self.transport = None
+        self.closed = None
+        self.devices = {}
+        self.pending_add_devices = {} # UID -> FIFO of (device, future)
+        self.enumerate_streams = []
+
+        self.data = bytearray(8192)
+        self.start = 0 # begin of the first unparsed packet
+        self.end = 0 # end of the received data
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        self.closed = loop.create_future()
+
+        try:
+            await loop.create_connection(lambda: self, self.host, self.port)
+        except OSError as e:
+            raise Error(Error.NO_CONNECT, 'Could not connect to ' + \
+                        str(self.host) + ':' + str(self.port) + ': ' + str(e))
+
+    def destroy(self):
+        """
+        Destroys the IP connection. The socket to the Brick Daemon will be
+        closed, pending requests fail and all callback streams end.
+        """
+
+        if self.transport is not None:
+            self.transport.close()
+
+    async def wait_closed(self):
+        """
+        Waits until the IP connection is :py:func:`destroyed <IPConnection.destroy>`
+        or lost.
+        """
+
+        await asyncio.shield(self.closed)
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+
+        for device in list(self.devices.values()):
+            for waiters in device.pending_responses.values():
+                while len(waiters) > 0:
+                    future = waiters.popleft()
+                    if not isinstance(future, StaleResponse) and not future.done():
+                        future.set_exception(Error(Error.NO_CONNECT, 'Connection lost'))
+
+            for streams in device.callback_streams.values():
+                for stream in list(streams):
+                    stream.close()
+
+        for pending in self.pending_add_devices.values():
+            for device, future in pending:
+                if not future.done():
+                    future.set_exception(Error(Error.NO_CONNECT, 'Connection lost'))
+
+        for stream in list(self.enumerate_streams):
+            stream.close()
+
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+    def get_buffer(self, sizehint):
+        if self.end == len(self.data):
+            self.data[0:self.end - self.start] = self.data[self.start:self.end]
+            self.end -= self.start
+            self.start = 0
+
+        return memoryview(self.data)[self.end:]
+
+    def buffer_updated(self, nbytes):
+        self.end += nbytes
+
+        while True:
+            if self.end - self.start < 4:
+                # Wait for complete header
+                break
+
+            length = self.data[self.start + 2] | (self.data[self.start + 3] << 8)
+
+            if length < 4 or length > len(self.data):
+                # A TCP stream can't be resynchronized, drop the connection,
+                # connection_lost then fails the pending requests
+                self.transport.abort()
+                return
+
+            if self.end - self.start < length:
+                # Wait for complete packet
+                break
+
+            packet = bytes(self.data[self.start:self.start + length])
+            self.start += length
+
+            self.handle_response(packet)
+
+        if self.start == self.end:
+            self.start = 0
+            self.end = 0
+
+    def write(self, request):
+        if self.transport is None:
+            raise Error(Error.NO_CONNECT, 'Not connected')
+
+        self.transport.write(request)
+
+    async def wait_response(self, future, msg):
+        try:
+            return await asyncio.wait_for(future, IPConnection.RESPONSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise Error(Error.TIMEOUT, msg)
+
+    async def send_request(self, device, function_id, data, form, form_ret):
+        form = get_format(form)
+        form_ret = get_format(form_ret)
+        request = form.pack(device.stack_id, function_id, data)
+
+        if form_ret.size == 0:
+            self.write(request)
+            return
+
+        # Responses are matched to futures in FIFO order per function ID,
+        # any number of requests can be in flight
+        future = asyncio.get_running_loop().create_future()
+        if not function_id in device.pending_responses:
+            device.pending_responses[function_id] = deque()
+        waiters = device.pending_responses[function_id]
+        waiters.append(future)
+        stale_drops = device.stale_drops.get(function_id, 0)
+
+        try:
+            self.write(request)
+        except Error:
+            waiters.remove(future)
+            raise
+
+        try:
+            response = await self.wait_response(future, 'Did not receive response for function ' + \
+                                                        str(function_id) + ' in time')
+        except (Error, asyncio.CancelledError):
+            self.abandon_future(device, function_id, future, stale_drops)
+            raise
+
+        return form_ret.unpack(response)
+
+    def abandon_future(self, device, function_id, future, stale_drops):
+        # The request was sent, its response might still arrive. Unless a
+        # StaleResponse ahead of it dropped a response in the meantime, that
+        # was most likely this one
+        waiters = device.pending_responses[function_id]
+        if future in waiters:
+            if stale_drops != device.stale_drops.get(function_id, 0):
+                waiters.remove(future)
+            else:
+                waiters[list(waiters).index(future)] = StaleResponse(IPConnection.RESPONSE_TIMEOUT)
+
+    def handle_response(self, packet):
+        function_id = get_function_id_from_data(packet)
+        if function_id == IPConnection.FUNCTION_GET_STACK_ID:
+            self.handle_add_device(packet)
+            return
+        if function_id == IPConnection.FUNCTION_ENUMERATE_CALLBACK:
+            self.handle_enumerate(packet)
+            return
+
+        stack_id = get_stack_id_from_data(packet)
+        if not stack_id in self.devices:
+            # Response from an unknown device, ignoring it
+            return
+
+        device = self.devices[stack_id]
+        waiters = device.pending_responses.get(function_id, ())
+        now = time.time()
+
+        # A timed out request that got no response at all
+        while len(waiters) > 0 and isinstance(waiters[0], StaleResponse) and waiters[0].expires < now:
+            waiters.popleft()
+
+        while len(waiters) > 0:
+            future = waiters.popleft()
+
+            if isinstance(future, StaleResponse):
+                device.stale_drops[function_id] = device.stale_drops.get(function_id, 0) + 1
+                return
+
+            if not future.done():
+                future.set_result(packet[4:])
+                return
+
+        streams = device.callback_streams.get(function_id, ())
+        if len(streams) > 0:
+            value = get_format(device.callback_formats[function_id]).unpack(packet[4:])
+            for stream in streams:
+                stream.put(value)
+
+        # Response seems to be OK, but can't be handled, most likely
+        # a callback without stream
+
+    def handle_enumerate(self, packet):
+        if len(self.enumerate_streams) == 0:
+            return
+
+        uid, name, stack_id, new = IPConnection.FORMAT_ENUMERATE_CALLBACK.unpack(packet[4:])
+
+        # Remove \0 from end of string
+        name = name.decode('ascii').replace(chr(0), '')
+
+        for stream in self.enumerate_streams:
+            stream.put((base58encode(uid), name, stack_id, new))
+
+    def enumerate(self, maxsize=0):
+        """
+        Requests an enumeration and returns an asynchronous iterator that
+        yields a tuple (*uid*, *name*, *stack_id*, *is_new*) for every
+        currently available device and for every device that is plugged in
+        (with *is_new* true) or unplugged (with *is_new* false) later on.
+        """
+
+        stream = CallbackStream(self.enumerate_streams, maxsize)
+        self.write(struct.pack('<BBH',
+                               IPConnection.BROADCAST_ADDRESS,
+                               IPConnection.FUNCTION_ENUMERATE,
+                               IPConnection.ENUMERATE_LENGTH))
+
+        return stream
+
+    def handle_add_device(self, packet):
+        uid, firmware_version, name, stack_id = \
+            IPConnection.FORMAT_GET_STACK_ID.unpack(packet[4:])
+
+        pending = self.pending_add_devices.get(uid, ())
+        if len(pending) == 0:
+            return
+
+        device, future = pending[0]
+        name = name.decode('ascii').replace(chr(0), '')
+
+        i = name.rfind(' ')
+        if i < 0 or name[0:i].replace('-', ' ') != device.expected_name.replace('-', ' '):
+            return
+
+        pending.popleft()
+        device.firmware_version = list(firmware_version)
+        device.name = name
+        device.stack_id = stack_id
+        self.devices[stack_id] = device
+
+        if not future.done():
+            future.set_result(None)
+
+    async def add_device(self, device):
+        """
+        Adds a device (Brick or Bricklet) to the IP connection. Every device
+        has to be added to an IP connection before it can be used. Several
+        devices can be added concurrently.
+        """
+
+        future = asyncio.get_running_loop().create_future()
+        if not device.uid in self.pending_add_devices:
+            self.pending_add_devices[device.uid] = deque()
+        self.pending_add_devices[device.uid].append((device, future))
+
+        try:
+            self.write(struct.pack('<BBHQ',
+                                   IPConnection.BROADCAST_ADDRESS,
+                                   IPConnection.FUNCTION_GET_STACK_ID,
+                                   IPConnection.GET_STACK_ID_LENGTH,
+                                   device.uid))
+            await self.wait_response(future, 'Could not add device ' + \
+                                             base58encode(device.uid) + ', timeout')
+        finally:
+            pending = self.pending_add_devices[device.uid]
+            if (device, future) in pending:
+                pending.remove((device, future))
+            if len(pending) == 0:
+                del self.pending_add_devices[device.uid]
+
+        device.ipcon = self
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Python Generator
+Copyright (C) 2012 Matthias Bolte <matthias@tinkerforge.com>
+
+python_common.py: Common Library for generation of Python bindings and simulator
+
+This program is free software; you can redistribute it and/or
+modify it under the terms of the GNU General Public License
+as published by the Free Software Foundation; either version 2
+of the License, or (at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+General Public License for more details.
+
+You should have received a copy of the GNU General Public
+License along with this program; if not, write to the
+Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+Boston, MA 02111-1307, USA.
+"""
+
+def make_format_from_element(element):
+    forms = {
+        'int8' : 'b',
+        'uint8' : 'B',
+        'int16' : 'h',
+        'uint16' : 'H',
+        'int32' : 'i',
+        'uint32' : 'I',
+        'int64' : 'q',
+        'uint64' : 'Q',
+        'float' : 'f',
+        'bool' : '?',
+        'string' : 's',
+        'char' : 'c'
+    }
+
+    if element[1] in forms:
+        return forms[element[1]]
+
+    return ''
+
+def make_format_list(packet, io):
+    forms = []
+    for element in packet.get_elements(io):
+        num = ''
+        if element[2] > 1:
+            num = element[2]
+        form = make_format_from_element(element)
+        forms.append('{0}{1}'.format(num, form))
+    return " ".join(forms)
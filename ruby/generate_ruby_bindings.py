@@ -132,48 +132,72 @@ def make_initialize_method():
                            device.get_display_name(),
                            device.get_category())
 
+def make_format_definitions():
+    formats = '\n'
+    form = "    FORMAT_{0}_{1} = Format.new {2} # :nodoc:\n"
+    for packet in device.get_packets('function'):
+        name = packet.get_upper_case_name()
+        formats += form.format('REQUEST', name, make_format(packet, 'in'))
+        formats += form.format('RESPONSE', name, make_format(packet, 'out'))
+    for packet in device.get_packets('callback'):
+        formats += form.format('CALLBACK', packet.get_upper_case_name(), make_format(packet, 'out'))
+    return formats
+
 def make_callback_formats():
     cbs = ''
-    cb = "      @callback_formats[CALLBACK_{0}] = '{1}'\n"
+    cb = "      @callback_formats[CALLBACK_{0}] = FORMAT_CALLBACK_{0}\n"
     for packet in device.get_packets('callback'):
-        form, _ = make_format_list(packet, 'out')
-        cbs += cb.format(packet.get_upper_case_name(), form)
+        cbs += cb.format(packet.get_upper_case_name())
     return cbs + '    end\n'
 
 def make_format_from_element(element):
     forms = {
-        'int8'   : ('c', 1),
-        'uint8'  : ('C', 1),
-        'int16'  : ('s', 2),
-        'uint16' : ('S', 2),
-        'int32'  : ('l', 4),
-        'uint32' : ('L', 4),
-        'int64'  : ('q', 8),
-        'uint64' : ('Q', 8),
-        'float'  : ('e', 4),
-        'bool'   : ('?', 1),
-        'string' : ('Z', 1),
-        'char'   : ('k', 1)
+        'int8'   : ('c', 1, 'nil'),
+        'uint8'  : ('C', 1, 'nil'),
+        'int16'  : ('s<', 2, 'nil'),
+        'uint16' : ('S<', 2, 'nil'),
+        'int32'  : ('l<', 4, 'nil'),
+        'uint32' : ('L<', 4, 'nil'),
+        'int64'  : ('q<', 8, 'nil'),
+        'uint64' : ('Q<', 8, 'nil'),
+        'float'  : ('e', 4, 'nil'),
+        'bool'   : ('C', 1, ':bool'),
+        'string' : ('Z', 1, 'nil'),
+        'char'   : ('C', 1, ':char')
     }
 
     if element[1] in forms:
         return forms[element[1]]
 
-    return '', 0
+    return '', 0, 'nil'
 
-def make_format_list(packet, io):
-    forms = []
+def make_format(packet, io):
+    # A single template for the whole payload, the fields are only listed if
+    # some of them are arrays or need a conversion
+    template = ''
     total_size = 0
+    fields = []
+    flat = True
     for element in packet.get_elements(io):
-        num_str = ''
-        num_int = 1
+        form, size, conversion = make_format_from_element(element)
+        count = 1
         if element[2] > 1:
-            num_str = element[2]
-            num_int = element[2]
-        form, size = make_format_from_element(element)
-        forms.append('{0}{1}'.format(form, num_str))
-        total_size += size * num_int
-    return " ".join(forms), total_size
+            template += '{0}{1}'.format(form, element[2])
+            total_size += size * element[2]
+            if element[1] != 'string':
+                count = element[2]
+        else:
+            template += form
+            total_size += size
+
+        if count > 1 or conversion != 'nil':
+            flat = False
+        fields.append('[{0}, {1}]'.format(count, conversion))
+
+    if flat:
+        return "'{0}', {1}".format(template, total_size)
+
+    return "'{0}', {1}, [{2}]".format(template, total_size, ', '.join(fields))
 
 def make_parameter_list(packet):
     params = []
@@ -182,16 +206,10 @@ def make_parameter_list(packet):
     return ', '.join(params)
 
 def make_methods():
-    method0 = """
-    # {4}
-    def {0}
-      send_request(FUNCTION_{1}, [], '', {2}, '{3}')
-    end
-"""
-    method1 = """
-    # {6}
-    def {0}({1})
-      send_request(FUNCTION_{2}, [{1}], '{3}', {4}, '{5}')
+    method = """
+    # {3}
+    def {0}{1}
+      send_request(FUNCTION_{2}, [{4}], FORMAT_REQUEST_{2}, FORMAT_RESPONSE_{2})
     end
 """
     methods = ''
@@ -202,13 +220,10 @@ def make_methods():
         parms = make_parameter_list(packet)
         doc = '\n    # '.join(fix_links(packet.get_doc()[1][lang]).strip().split('\n'))
 
-        in_format, _ = make_format_list(packet, 'in')
-        out_format, out_size = make_format_list(packet, 'out')
-
         if len(parms) > 0:
-            methods += method1.format(name, parms, fid, in_format, out_size, out_format, doc)
+            methods += method.format(name, '({0})'.format(parms), fid, doc, parms)
         else:
-            methods += method0.format(name, fid, out_size, out_format, doc)
+            methods += method.format(name, '', fid, doc, parms)
 
     return methods
 
@@ -239,11 +254,12 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    py = file('{0}/{1}.rb'.format(directory, file_name), "w")
+    py = common.open_output('{0}/{1}.rb'.format(directory, file_name), "w")
     py.write(make_header())
     py.write(make_class())
     py.write(make_callback_id_definitions())
     py.write(make_function_id_definitions())
+    py.write(make_format_definitions())
     py.write(make_initialize_method())
     py.write(make_callback_formats())
     py.write(make_methods())
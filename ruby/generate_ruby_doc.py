@@ -358,9 +358,9 @@ Alle folgend aufgelisteten Methoden sind Thread-sicher.
 
     return api[lang].format(ref, api_desc, api_str)
 
-def copy_examples_for_zip():
+def copy_examples_for_zip(generator_path):
     examples = common.find_examples(device, file_path, 'ruby', 'example_', '.rb')
-    dest = os.path.join('/tmp/generator/gem/examples/',
+    dest = os.path.join(generator_path, 'gem/examples',
                         device.get_category().lower(),
                         device.get_underscore_name())
 
@@ -372,7 +372,9 @@ def copy_examples_for_zip():
 
 def make_files(com_new, directory):
     global device
+    global file_path
     device = common.Device(com_new)
+    file_path = directory
     file_name = '{0}_{1}_Ruby'.format(device.get_camel_case_name(), device.get_category())
     title = {
     'en': 'Ruby bindings',
@@ -383,62 +385,53 @@ def make_files(com_new, directory):
     if not os.path.exists(directory):
         os.makedirs(directory)
 
-    f = file('{0}/{1}.rst'.format(directory, file_name), "w")
+    f = common.open_output('{0}/{1}.rst'.format(directory, file_name), "w")
     f.write(common.make_rst_header(device, 'ruby', 'Ruby'))
     f.write(common.make_rst_summary(device, title[lang]))
     f.write(make_examples())
     f.write(make_api())
 
-    copy_examples_for_zip()
-
-def generate(path):
+def make_package(path):
+    global device
     global file_path
     file_path = path
-    path_list = path.split('/')
-    path_list[-1] = 'configs'
-    path_config = '/'.join(path_list)
-    sys.path.append(path_config)
-    configs = os.listdir(path_config)
 
     # Make temporary generator directory
-    if os.path.exists('/tmp/generator'):
-        shutil.rmtree('/tmp/generator/')
-    os.makedirs('/tmp/generator/gem/source/lib/tinkerforge')
-    os.chdir('/tmp/generator')
-
-    # Make bindings
-    for config in configs:
-        if config.endswith('_config.py'):
-            module = __import__(config[:-3])
-            print(" * {0}".format(config[:-10]))
-            make_files(module.com, path)
-
-    # Copy bindings and readme
-    for filename in glob.glob(path + '/bindings/*.rb'):
-        shutil.copy(filename, '/tmp/generator/gem/source/lib/tinkerforge')
-
-    shutil.copy(path + '/ip_connection.rb', '/tmp/generator/gem/source/lib/tinkerforge')
-    shutil.copy(path + '/changelog.txt', '/tmp/generator/gem')
-    shutil.copy(path + '/readme.txt', '/tmp/generator/gem')
-
-    # Write version.rb
-    version = common.get_changelog_version(path)
-    file('/tmp/generator/gem/source/lib/tinkerforge/version.rb', 'wb').write("""
+    generator_path = common.make_temp_dir('generator')
+    try:
+        os.makedirs(generator_path + '/gem/source/lib/tinkerforge')
+
+        # Copy examples
+        for config in common.get_configs(path):
+            device = common.Device(common.load_config(path, config))
+            copy_examples_for_zip(generator_path)
+
+        # Copy bindings and readme
+        for filename in glob.glob(path + '/bindings/*.rb'):
+            shutil.copy(filename, generator_path + '/gem/source/lib/tinkerforge')
+
+        shutil.copy(path + '/ip_connection.rb', generator_path + '/gem/source/lib/tinkerforge')
+        shutil.copy(path + '/changelog.txt', generator_path + '/gem')
+        shutil.copy(path + '/readme.txt', generator_path + '/gem')
+
+        # Write version.rb
+        version = common.get_changelog_version(path)
+        file(generator_path + '/gem/source/lib/tinkerforge/version.rb', 'wb').write("""
 module Tinkerforge
   VERSION = '{0}.{1}.{2}'
 end
 """.format(*version))
 
-    # Write tinkerforge.rb
-    file('/tmp/generator/gem/source/lib/tinkerforge.rb', 'wb').write("""
+        # Write tinkerforge.rb
+        file(generator_path + '/gem/source/lib/tinkerforge.rb', 'wb').write("""
 require 'tinkerforge/version'
 
 module Tinkerforge
 end
 """)
 
-    # Write tinkerforge.gemspec
-    file('/tmp/generator/gem/source/tinkerforge.gemspec', 'wb').write("""
+        # Write tinkerforge.gemspec
+        file(generator_path + '/gem/source/tinkerforge.gemspec', 'wb').write("""
 spec = Gem::Specification.new do |s|
   s.name = 'tinkerforge'
   s.version = '{0}.{1}.{2}'
@@ -452,26 +445,32 @@ spec = Gem::Specification.new do |s|
 end
 """.format(*version))
 
-    # Make gem
-    os.chdir('/tmp/generator/gem/source')
-    args = ['/usr/bin/gem',
-            'build',
-            'tinkerforge.gemspec']
-    subprocess.call(args)
-
-    # Remove build stuff
-    os.remove('/tmp/generator/gem/source/tinkerforge.gemspec')
-    shutil.move('/tmp/generator/gem/source/tinkerforge-{0}.{1}.{2}.gem'.format(*version),
-                '/tmp/generator/gem/tinkerforge.gem')
-    shutil.move('/tmp/generator/gem/source/lib/tinkerforge.rb',
-                '/tmp/generator/gem/source/')
-    os.makedirs('/tmp/generator/gem/source/tinkerforge')
-    for filename in glob.glob('/tmp/generator/gem/source/lib/tinkerforge/*.rb'):
-        shutil.move(filename, '/tmp/generator/gem/source/tinkerforge/')
-    shutil.rmtree('/tmp/generator/gem/source/lib/')
-
-    # Make zip
-    common.make_zip('ruby', '/tmp/generator/gem', path, version)
+        # Make gem
+        args = ['/usr/bin/gem',
+                'build',
+                'tinkerforge.gemspec']
+        subprocess.call(args, cwd=generator_path + '/gem/source')
+
+        # Remove build stuff
+        os.remove(generator_path + '/gem/source/tinkerforge.gemspec')
+        shutil.move(generator_path + '/gem/source/tinkerforge-{0}.{1}.{2}.gem'.format(*version),
+                    generator_path + '/gem/tinkerforge.gem')
+        shutil.move(generator_path + '/gem/source/lib/tinkerforge.rb',
+                    generator_path + '/gem/source/')
+        os.makedirs(generator_path + '/gem/source/tinkerforge')
+        for filename in glob.glob(generator_path + '/gem/source/lib/tinkerforge/*.rb'):
+            shutil.move(filename, generator_path + '/gem/source/tinkerforge/')
+        shutil.rmtree(generator_path + '/gem/source/lib/')
+
+        # Make zip
+        common.make_zip('ruby', generator_path + '/gem', path, version)
+    finally:
+        # Remove temporary generator directory
+        shutil.rmtree(generator_path)
+
+def generate(path):
+    common.generate(path, make_files)
+    make_package(path)
 
 if __name__ == "__main__":
     generate(os.getcwd())
@@ -36,112 +36,85 @@ module Tinkerforge
   class TimeoutException < RuntimeError
   end
 
-  def pack(unpacked, format)
-    data = ''
-    format.split(' ').each do |f|
-      if f.length > 1
-        f0 = f[0, 1]
-        f1 = f[1..-1]
-        r = []
-
-        if f0 == '?'
-          unpacked[0].each { |b| r << b ? 1 : 0 }
-          data += r.pack "C#{f1}"
-        elsif f0 == 'k'
-          unpacked[0].each { |c| r << c.ord }
-          data += r.pack "c#{f1}"
-        else
-          r = unpacked[0]
-          if ['s', 'S', 'l', 'L', 'q', 'Q'].count(f0) > 0
-            data += r.pack "#{f0}<#{f1}"
-          elsif f0 == 'Z'
-            data += [r].pack "#{f0}#{f1}"
-          else
-            data += r.pack "#{f0}#{f1}"
-          end
-        end
-      else
-        if f == '?'
-          r = [unpacked[0] ? 1 : 0]
-          data += r.pack 'C'
-        elsif f == 'k'
-          r = [unpacked[0].ord]
-          data += r.pack 'c'
-        else
-          r = [unpacked[0]]
-          if ['s', 'S', 'l', 'L', 'q', 'Q'].count(f) > 0
-            data += r.pack "#{f}<"
+  # Precompiled layout of the payload of a request, response or callback.
+  # <tt>template</tt> is a single String#pack template for the whole
+  # payload, e.g. 'S<Z40C3' and <tt>size</tt> is its length in bytes. If
+  # needed, <tt>fields</tt> describes every field as [count, conversion]:
+  # arrays are <tt>count</tt> values, :bool and :char fields are converted
+  # from and to integers. Without <tt>fields</tt> every field is a single
+  # value that needs no conversion.
+  class Format
+    attr_reader :size
+
+    def initialize(template, size, fields = nil)
+      @size = size
+      @fields = fields
+      @request_template = 'CCS<' + template
+      @response_template = 'x4' + template # skips the header
+    end
+
+    # Returns the whole request packet for <tt>values</tt>.
+    def pack(stack_id, function_id, values)
+      if @fields != nil
+        flat = []
+        @fields.each_with_index do |field, i|
+          count, conversion = field
+          value = values[i]
+
+          if count > 1
+            value = value.map { |v| convert_to(v, conversion) }
+            flat.concat value
           else
-            data += r.pack f
+            flat << convert_to(value, conversion)
           end
         end
+        values = flat
       end
 
-      unpacked = unpacked.drop 1
+      [stack_id, function_id, 4 + @size].concat(values).pack @request_template
     end
 
-    data
-  end
+    # Returns the values of the payload of a whole <tt>packet</tt>.
+    def unpack(packet)
+      values = packet.unpack @response_template
 
-  def unpack(data, format)
-    unpacked = []
-    format.split(' ').each do |f|
-      if f.length > 1
-        f0 = f[0, 1]
-        f1 = f[1..-1]
-        u = []
-
-        if f0 == '?'
-          r = data.unpack "C#{f1}a*"
-          data = r[-1]
-          r.delete_at(-1)
-          r.each { |b| u << b != 0 }
-        elsif f0 == 'k'
-          r = data.unpack "c#{f1}a*"
-          data = r[-1]
-          r.delete_at(-1)
-          r.each { |c| u << c.chr }
-        else
-          if ['s', 'S', 'l', 'L', 'q', 'Q'].count(f0) > 0
-            r = data.unpack "#{f}<a*"
+      if @fields != nil
+        grouped = []
+        i = 0
+        @fields.each do |count, conversion|
+          if count > 1
+            grouped << values[i, count].map { |v| convert_from(v, conversion) }
           else
-            r = data.unpack "#{f}a*"
+            grouped << convert_from(values[i], conversion)
           end
-          data = r[-1]
-          r.delete_at(-1)
-          r.each { |i| u << i }
+          i += count
         end
+        values = grouped
+      end
 
-        if u.length == 1
-          u = u[0]
-        end
+      values
+    end
 
-        unpacked << u
+    private
+    def convert_to(value, conversion)
+      if conversion == :bool
+        value ? 1 : 0
+      elsif conversion == :char
+        value.ord
       else
-        r = []
-        u = nil
-
-        if f == '?'
-          r = data.unpack "Ca*"
-          u = r[0] != 0
-        elsif f == 'k'
-          r = data.unpack "ca*"
-          u = r[0].chr
-        else
-          if ['s', 'q', 'l', 'L', 'S', 'Q'].count(f) > 0
-            r = data.unpack "#{f}<a*"
-          else
-            r = data.unpack "#{f}a*"
-          end
-          u = r[0]
-        end
-
-        data = r[1]
-        unpacked << u
+        value
       end
     end
 
-    unpacked
+    def convert_from(value, conversion)
+      if conversion == :bool
+        value != 0
+      elsif conversion == :char
+        value.chr
+      else
+        value
+      end
+    end
   end
 
   class Device
@@ -182,25 +155,18 @@ module Tinkerforge
       @registered_callbacks = {}
     end
 
-    def send_request(function_id, request_data, request_format,
-                     response_length, response_format)
+    def send_request(function_id, request_data, request_format, response_format)
       if @ipcon == nil
         raise Exception, 'Not added to IPConnection'
       end
 
-      payload = ''
       response = nil
-
-      if request_data.length > 0
-        payload = pack request_data, request_format
-      end
-
-      request = pack([@stack_id, function_id, 4 + payload.length], 'C C S') + payload
+      request = request_format.pack @stack_id, function_id, request_data
 
       @request_mutex.synchronize {
-        if response_length > 0
+        if response_format.size > 0
           @expected_response_function_id = function_id
-          @expected_response_length = 4 + response_length
+          @expected_response_length = 4 + response_format.size
         else
           @expected_response_function_id = 0
           @expected_response_length = 0
@@ -208,9 +174,9 @@ module Tinkerforge
 
         @ipcon.send request
 
-        if response_length > 0
+        if response_format.size > 0
           packet = dequeue_response
-          response = unpack packet[4..-1], response_format
+          response = response_format.unpack packet
 
           if response.length == 1
             response = response[0]
@@ -250,6 +216,11 @@ module Tinkerforge
     FUNCTION_ENUMERATE = 254
     FUNCTION_ENUMERATE_CALLBACK = 253
 
+    FORMAT_EMPTY = Format.new '', 0 # :nodoc:
+    FORMAT_GET_STACK_ID_REQUEST = Format.new 'Q<', 8 # :nodoc:
+    FORMAT_GET_STACK_ID_RESPONSE = Format.new 'Q<C3Z40C', 52, [[1, nil], [3, nil], [1, nil], [1, nil]] # :nodoc:
+    FORMAT_ENUMERATE_CALLBACK = Format.new 'Q<Z40CC', 50, [[1, nil], [1, nil], [1, nil], [1, :bool]] # :nodoc:
+
     # Creates an IP connection to the Brick Daemon with the given *host*
     # and *port*. With the IP connection itself it is possible to enumerate the
     # available devices. Other then that it is only used to add Bricks and
@@ -277,7 +248,7 @@ module Tinkerforge
       @add_device_mutex.synchronize {
         begin
           @pending_add_device = device
-          request = pack [BROADCAST_ADDRESS, FUNCTION_GET_STACK_ID, 4 + 8, device.uid], 'C C S Q'
+          request = FORMAT_GET_STACK_ID_REQUEST.pack BROADCAST_ADDRESS, FUNCTION_GET_STACK_ID, [device.uid]
 
           send request
           device.dequeue_response "Could not add device #{Base58.encode(device.uid)}, timeout"
@@ -338,7 +309,7 @@ module Tinkerforge
     def enumerate(&block)
       @enumerate_callback = block
 
-      send pack([BROADCAST_ADDRESS, FUNCTION_ENUMERATE, 4], 'C C S')
+      send FORMAT_EMPTY.pack(BROADCAST_ADDRESS, FUNCTION_ENUMERATE, [])
     end
 
     def send(request)
@@ -347,26 +318,20 @@ module Tinkerforge
 
     private
     def receive_loop
-      pending_data = ''
+      # Blocks in recv without a poll timeout, destroy wakes it up by
+      # shutting down the socket. Complete packets are cut out at an offset
+      # into pending_data, which is only compacted once per recv
+      pending_data = String.new
+      offset = 0
 
       while @thread_receive_flag
-        begin
-          result = IO.select [@socket], [], [], 1
-        rescue IOError
-          break
-        end
-
-        if result == nil or result[0].length < 1
-          next
-        end
-
         begin
           data = @socket.recv 8192
         rescue IOError
           break
         end
 
-        if data.length == 0
+        if data == nil or data.length == 0
           if @thread_receive_flag
             $stderr.puts 'Socket disconnected by Server, destroying IPConnection'
             destroy
@@ -374,25 +339,33 @@ module Tinkerforge
           break
         end
 
-        pending_data += data
+        pending_data << data
 
         while true
-          if pending_data.length < 4
+          if pending_data.bytesize - offset < 4
             # Wait for complete header
             break
           end
 
-          length = get_length_from_data pending_data
+          length = get_length_from_data pending_data, offset
 
-          if pending_data.length < length
+          if pending_data.bytesize - offset < length
             # Wait for complete packet
             break
           end
 
-          packet = pending_data[0, length]
-          pending_data = pending_data[length..-1]
+          packet = pending_data.byteslice offset, length
+          offset += length
           handle_response packet
         end
+
+        if offset == pending_data.bytesize
+          pending_data.clear
+          offset = 0
+        elsif offset > 0
+          pending_data = pending_data.byteslice offset, pending_data.bytesize - offset
+          offset = 0
+        end
       end
     end
 
@@ -408,7 +381,7 @@ module Tinkerforge
         function_id = get_function_id_from_data packet
 
         if function_id == FUNCTION_ENUMERATE_CALLBACK
-          payload = unpack packet[4..-1], 'Q Z40 C ?'
+          payload = FORMAT_ENUMERATE_CALLBACK.unpack packet
 
           uid = Base58::encode(payload[0])
           name = payload[1]
@@ -420,7 +393,7 @@ module Tinkerforge
           device = @devices[stack_id]
 
           if device.registered_callbacks.has_key? function_id
-            payload = unpack packet[4..-1], device.callback_formats[function_id]
+            payload = device.callback_formats[function_id].unpack packet
             device.registered_callbacks[function_id].call(*payload)
           end
         end
@@ -435,8 +408,8 @@ module Tinkerforge
       data[1, 1].ord
     end
 
-    def get_length_from_data data
-      data[2, 2].unpack('S<')[0]
+    def get_length_from_data(data, offset = 0)
+      data.getbyte(offset + 2) | (data.getbyte(offset + 3) << 8)
     end
 
     def handle_response(packet)
@@ -485,20 +458,20 @@ module Tinkerforge
         return
       end
 
-      payload = unpack packet[4..-1], 'Q C C C Z40 C'
+      payload = FORMAT_GET_STACK_ID_RESPONSE.unpack packet
 
       if @pending_add_device.uid == payload[0]
-        name = payload[4]
+        name = payload[2]
         i = name.rindex ' '
 
         if i == nil or name[0, i].gsub('-', ' ') != @pending_add_device.expected_name.gsub('-', ' ')
           return
         end
 
-        @pending_add_device.firmware_version = [payload[1], payload[2], payload[3]]
+        @pending_add_device.firmware_version = payload[1]
         @pending_add_device.name = name
-        @pending_add_device.stack_id = payload[5]
-        @devices[payload[5]] = @pending_add_device
+        @pending_add_device.stack_id = payload[3]
+        @devices[payload[3]] = @pending_add_device
         @pending_add_device.enqueue_response nil
       end
     end